@@ -1,277 +1,392 @@
-import serial
+import threading
 import time
-import struct
-
-class HCP1020Controller:
-    def __init__(self, port, slave_id=1, baudrate=9600):
-        self.ser = serial.Serial(
-            port=port,
-            baudrate=baudrate,
-            bytesize=8,
-            parity='N',
-            stopbits=1,
-            timeout=1
-        )
-        self.slave_id = slave_id
+from crc16 import crc16_bytes
+from connection_pool import default_pool
+import hcp1020_protocol
+from hcp1020_protocol import HCP1020Protocol, Read, Write, WriteMultiple
+from modbus_tcp import parse_tcp_url, TcpRtuPort
+from modbus_rtu import (frame_silence, FrameCodec, decode_registers, validate_response,
+                        settle_after_timeout, MAX_FRAME,
+                        ModbusError, ModbusTimeoutError, ModbusExceptionResponse)
+
+# 等待到单调时钟的绝对时刻：先粗略sleep，最后2ms自旋，避免sleep精度误差
+def sleep_until(deadline, spin=0.002):
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if remaining > spin:
+            time.sleep(remaining - spin)
+
+class HCP1020Controller(HCP1020Protocol):
+    # port可以是串口名，也可以是已打开的串口对象（如hcp1020_sim.SimulatedSerial）
+    # 串口名在第一次通信时才打开，默认从connection_pool.default_pool借用，串口名和波特率相同的控制器共享同一串口，
+    # 各自的timeout在每次事务前设置；
+    # pool=None时单独打开；用完调用close()归还
+    # port='tcp://host:port'时经MODBUS TCP网关（modbus_gateway.py）访问，与其他进程共享串口
+    def __init__(self, port, slave_id=1, baudrate=9600, timeout=1, max_read_registers=125,
+                 shadow=False, shadow_ttl=5.0, retries=2, retry_backoff=0.01, retry_backoff_max=0.2,
+                 pool=default_pool):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout  # 等待响应首字节的超时时间
+        self.pool = pool
+        if isinstance(port, str):
+            self._ser = None
+        else:
+            self._ser = self._configure(port)
+        self._init_state(slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                         retry_backoff_max)
+
+    # 与串口无关的状态，总线上的从站句柄（rs485_bus.BusSlaveController）也用它初始化
+    def _init_state(self, slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                    retry_backoff_max):
+        super()._init_state(slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                            retry_backoff_max)
+        self._codec = FrameCodec()  # 预分配的收发缓冲区
+        # 事务锁：同一控制器可以被多个线程使用（如调节器线程和主线程的查询），事务及对接收缓冲区的使用串行执行；
+        # 串口从连接池借用时换成该串口的锁，共用串口的控制器之间也串行执行
+        self._transaction_lock = threading.RLock()
+        self._late_until = None  # 上次事务超时后，迟到的响应可能到达的最晚时刻
     
+    # 串口在第一次访问时打开
+    @property
+    def ser(self):
+        if self._ser is None:
+            self._ser = self._open()
+        return self._ser
+
+    def _pool_key(self):
+        return ('serial', self.port, self.baudrate, 8, 'N', 1)
+
+    def _open_serial(self):
+        tcp = parse_tcp_url(self.port)
+        if tcp is not None:
+            return TcpRtuPort(*tcp, timeout=self.timeout)
+        import serial  # 只有按串口名打开时才需要pyserial
+        return serial.Serial(port=self.port, baudrate=self.baudrate, bytesize=8, parity='N',
+                             stopbits=1, timeout=self.timeout)
+
+    def _open(self):
+        if self.pool is None:
+            return self._configure(self._open_serial())
+        key = self._pool_key()
+        ser = self.pool.acquire(key, self._open_serial, check=lambda ser: ser.is_open)
+        self._transaction_lock = self.pool.connection_lock(key, ser)
+        with self._transaction_lock:  # 其他借用者可能正在收发
+            return self._configure(ser)
+
+    # 返回事务锁；串口尚未打开时先打开，第一次事务也持有共用串口的锁
+    def _locked(self):
+        if self._ser is None and isinstance(self.port, str):
+            self._ser = self._open()
+        return self._transaction_lock
+
+    def _configure(self, ser):
+        ser.timeout = self.timeout
+        # 字节间超过3.5字符静默即认为帧结束
+        ser.inter_byte_timeout = frame_silence(self.baudrate)
+        return ser
+
+    # 归还或关闭由本控制器打开的串口；传入的串口对象由调用者负责关闭
+    def close(self):
+        if self._ser is None or not isinstance(self.port, str):
+            return
+        if self.pool is None:
+            self._ser.close()
+        else:
+            self.pool.release(self._pool_key(), self._ser)
+        self._ser = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def _calculate_crc(self, data):
-        # MODBUS CRC16计算实现
-        crc = 0xFFFF
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x0001:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        return crc.to_bytes(2, 'little')
-    
-    def _send_modbus_command(self, function_code, register, values=None, value=None):
-        if function_code == 0x06:  # 写单个寄存器
-            frame = struct.pack('>BBHH', 
-                self.slave_id, 
-                function_code, 
-                register, 
-                value
-            )
-        elif function_code == 0x03:  # 读寄存器
-            frame = struct.pack('>BBHH', 
-                self.slave_id, 
-                function_code, 
-                register, 
-                1  # 读取长度
-            )
-        elif function_code == 0x10:  # 写多个寄存器
-            byte_count = len(values) * 2
-            data_part = b''.join([struct.pack('>H', v) for v in values])
-            frame = struct.pack('>BBHHB',
-                self.slave_id,
-                function_code,
-                register,
-                len(values),  # 寄存器数量
-                byte_count
-            ) + data_part
-    
-        crc = self._calculate_crc(frame)
-        self.ser.write(frame + crc)
-        time.sleep(0.1)
-        return self.ser.read_all()
-    
+        # MODBUS CRC16计算（查表实现，见crc16.py）
+        return crc16_bytes(data)
     
+    def _send_modbus_command(self, function_code, register, value=None, values=None, read_length=1):
+        # 复制一份响应，调用者可长期持有
+        with self._locked():
+            return bytes(self._command(function_code, register, value, values, read_length))
+
+    # 执行hcp1020_protocol中的操作生成器，通信失败时把ModbusError抛回生成器
+    def _run(self, operation):
+        send = operation.send
+        result = None
+        while True:
+            try:
+                step = send(result)
+            except StopIteration as stop:
+                return stop.value
+            send = operation.send
+            try:
+                if type(step) is Read:
+                    result = self.read_registers(step.register, step.count, step.deadline)
+                elif type(step) is Write:
+                    result = self._send_modbus_command(0x06, step.register, step.value)
+                elif type(step) is WriteMultiple:
+                    result = self._send_modbus_command(0x10, step.register, values=step.values)
+                else:
+                    sleep_until(step.deadline)
+                    result = None
+            except ModbusError as e:
+                send, result = operation.throw, e
+
+    # 执行一次命令，返回校验通过的响应（可能指向接收缓冲区，仅在下一次命令前有效）
+    # 通信失败时抛出ModbusError的子类；deadline见hcp1020_protocol.Read
+    def _command(self, function_code, register, value=None, values=None, read_length=1, deadline=None):
+        if self.shadow is not None:
+            cached = self._shadow_lookup(function_code, register, value, values, read_length)
+            if cached is not None:
+                return cached
+            if function_code == 0x10:
+                register, values = self._shadow_trim(register, values)
+        inst = self.instrumentation
+        if inst is None:
+            frame = self._codec.encode(self.slave_id, function_code, register, value, values, read_length)
+        else:
+            start = time.perf_counter()
+            frame = self._codec.encode(self.slave_id, function_code, register, value, values, read_length)
+            inst.observe('encode', time.perf_counter() - start)
+        count = len(values) if function_code == 0x10 else read_length
+        try:
+            response = self._exchange(frame, function_code, register, value, count, deadline)
+        except ModbusError:
+            if self.shadow is not None and function_code != 0x03:
+                self._shadow_update(function_code, register, value, values, read_length, b'')
+            raise
+        if self.shadow is not None:
+            self._shadow_update(function_code, register, value, values, read_length, response)
+        return response
+
+    # 发送请求并校验响应；校验失败时先尝试重新同步，仍失败则按退避时间重发（重试策略见_retry_delay）
+    def _exchange(self, frame, function_code, register, value, count, deadline=None):
+        attempt = 0
+        while True:
+            response = self._transact(frame, function_code, register, deadline)
+            try:
+                return self._validate(response, function_code, register, value, count)
+            except ModbusError as e:
+                time.sleep(self._retry_delay(e, attempt, deadline))
+            attempt += 1
+
+    def _validate(self, response, function_code, register, value, count):
+        try:
+            validate_response(response, self.slave_id, function_code, register, value, count)
+            return response
+        except (ModbusTimeoutError, ModbusExceptionResponse):
+            raise
+        except ModbusError:
+            # 读完线路上剩余的数据，从中找属于本次请求的帧
+            frame = self._resync(bytes(response) + self._drain(), function_code, register, value, count)
+            if frame is None:
+                raise
+            return frame
+
+    # 读取线路上剩余的字节直到帧间静默，用于重新同步
+    def _drain(self):
+        timeout = self.ser.timeout
+        self.ser.timeout = self.ser.inter_byte_timeout * 10  # 只等待很短时间
+        try:
+            return self.ser.read(MAX_FRAME)
+        finally:
+            self.ser.timeout = timeout
+
+    # 发送一帧并读取响应；deadline不为None时等待响应不超过deadline（time.monotonic()）
+    def _transact(self, frame, function_code, register, deadline=None):
+        if self._late_until is not None and not self._settle(function_code, deadline):
+            return b''  # 期限前等不到上一个请求迟到的响应，按超时处理
+        # 共享的串口上其他控制器可能设置了不同的超时时间
+        timeout = self.timeout if deadline is None else max(deadline - time.monotonic(), 0.0)
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+        if self.instrumentation is not None:
+            response = self._transact_instrumented(frame)
+        else:
+            self.ser.reset_input_buffer()  # 丢弃上一次事务残留的字节
+            start = time.perf_counter()
+            self.ser.write(frame)
+            response = self._codec.read_frame(self.ser)
+            self._record_latency(time.perf_counter() - start, response)
+        if not response and self.timeout:
+            # 之后一个超时时间内到达的字节都可能是本次请求迟到的响应
+            self._late_until = time.monotonic() + self.timeout
+        return response
+
+    # 超时后的下一次发送前丢弃迟到的响应（见settle_after_timeout），返回能否发送
+    def _settle(self, function_code, deadline=None):
+        if isinstance(self.ser, TcpRtuPort):  # TCP端口按事务号丢弃迟到的响应
+            self._late_until = None
+            return True
+        self._late_until, ready = settle_after_timeout(self.ser, function_code, self._late_until,
+                                                       frame_silence(self.baudrate), deadline)
+        return ready
+
+    # 带分阶段计时的事务：写入、首字节（响应头）、整帧
+    def _transact_instrumented(self, frame):
+        inst = self.instrumentation
+        self.ser.reset_input_buffer()
+        start = time.perf_counter()
+        self.ser.write(frame)
+        written = time.perf_counter()
+        received = self._codec.read_header(self.ser)
+        first_byte = time.perf_counter()
+        response = self._codec.read_rest(self.ser, received)
+        end = time.perf_counter()
+        inst.observe('write', written - start)
+        inst.observe('first_byte', first_byte - written)
+        inst.observe('full_frame', end - start)
+        self._count_response(response)
+        self._record_latency(end - start, response)
+        return response
+
+    # 发送预先编码好的请求帧（如modbus_rtu.encode_write_frames生成的帧），返回校验通过的响应
+    # 跳过编码和影子缓存查找，用于闭环调节、波形流等热路径；写入的寄存器从影子缓存中移除
+    # count: 0x03为读取数量，0x10为写入数量；value: 0x06写入的值，用于校验回显
+    def send_frame(self, frame, function_code, register, value=None, count=1):
+        with self._locked():
+            if self.shadow is not None and function_code != 0x03:
+                self.invalidate_shadow(range(register, register + count))
+            # 释放锁后接收缓冲区可能被其他线程的事务覆盖，返回副本
+            return bytes(self._exchange(frame, function_code, register, value, count))
+
+    # 一次事务读取连续count个寄存器
+    def read_registers(self, register, count, deadline=None):
+        with self._locked():
+            response = self._command(0x03, register, read_length=count, deadline=deadline)
+            inst = self.instrumentation
+            if inst is None:
+                return decode_registers(response, count)
+            start = time.perf_counter()
+            registers = decode_registers(response, count)
+            inst.observe('decode', time.perf_counter() - start)
+            return registers
+
+    # 以下方法的请求构造和响应解析见hcp1020_protocol中的同名函数，modbus_async.AsyncHCP1020Controller共用
+
+    # 按规划读取多个寄存器区间，返回 {地址: 值}
+    def read_register_blocks(self, ranges, max_gap=0):
+        return self._run(hcp1020_protocol.read_register_blocks(ranges, self.max_read_registers, max_gap))
+
+    # 一次轮询读取全部遥测寄存器并解析为物理值
+    def query_telemetry(self):
+        return self._run(hcp1020_protocol.query_telemetry(self.max_read_registers))
+
     # 电压控制 (0x03寄存器)
     def set_voltage(self, volts):
-        reg_value = int(volts * 100)  # 转换为10mV单位
-        return self._send_modbus_command(0x06, 0x0003, reg_value)
+        return self._run(hcp1020_protocol.set_voltage(volts))
     
     # 电流控制 (0x04寄存器)
     def set_current(self, amps):
-        reg_value = int(amps * 1000)  # 转换为1mA单位
-        return self._send_modbus_command(0x06, 0x0004, reg_value)
+        return self._run(hcp1020_protocol.set_current(amps))
     
-    # 输出开关控制 (0x05寄存器位0)
+    # 输出开关控制 (0x05寄存器位0)，state: True=开启, False=关闭
     def set_output(self, state):
-        # state: True=开启, False=关闭
-        value = 0x0001 if state else 0x0000
-        return self._send_modbus_command(0x06, 0x0005, value)
+        return self._run(hcp1020_protocol.set_output(state))
     
-    #设定输出电压，电流，输出开命令
+    #设定输出电压，电流，输出开命令（0x10写入0x0003起3个寄存器）
     def set_voltage_current_output(self, volts, amps, output_state):
-        # 将物理值转换为寄存器值
-        voltage_reg = int(volts * 100)  # 电压单位：10mV
-        current_reg = int(amps * 1000)  # 电流单位：1mA
-        output_reg = 0x0001 if output_state else 0x0000
-        # 构造数据部分（电压 + 电流 + 输出状态）
-        data_values = [voltage_reg, current_reg, output_reg]
-        # 调用通用发送函数（需要扩展_send_modbus_command支持功能码0x10）
-        return self._send_modbus_command(
-            function_code=0x10,
-            register=0x0003,  # 起始寄存器地址
-            values=data_values  # 要写入的值列表
-        )
+        return self._run(hcp1020_protocol.set_voltage_current_output(volts, amps, output_state))
     
+    # 设定过压、过流保护值（0x10写入0x0006起2个寄存器）
     def set_protection_values(self, ovp_volts, ocp_amps):
-        # 将物理值转换为寄存器值
-        ovp_reg = int(ovp_volts * 100)  # OVP单位：10mV (0x07D0=2000 → 20.00V)
-        ocp_reg = int(ocp_amps * 1000)  # OCP单位：1mA (0x0C80=3200 → 3.200A)
-        # 调用通用发送函数（使用功能码0x10写多个寄存器）
-        return self._send_modbus_command(
-            function_code=0x10,
-            register=0x0006,  # OVP寄存器起始地址
-            values=[ovp_reg, ocp_reg]  # 要写入的值列表[OVP, OCP]
-        )
+        return self._run(hcp1020_protocol.set_protection_values(ovp_volts, ocp_amps))
 
     # 过压保护设置 (0x06寄存器)
     def set_ovp(self, volts):
-        reg_value = int(volts * 100)  # 转换为10mV单位
-        return self._send_modbus_command(0x06, 0x0006, reg_value)
+        return self._run(hcp1020_protocol.set_ovp(volts))
     
     # 过流保护设置 (0x07寄存器)
     def set_ocp(self, amps):
-        reg_value = int(amps * 1000)  # 转换为1mA单位
-        return self._send_modbus_command(0x06, 0x0007, reg_value)
+        return self._run(hcp1020_protocol.set_ocp(amps))
     
     #设置输出开，过压保护功能开，过流保护功能开
     def set_output_protections(self, output_on=True, ovp_enable=True, ocp_enable=True):
-        # 根据状态位说明构造控制字
-        control_word = 0x0000
-        if output_on:
-            control_word |= 0x0001  # 位0：输出开关
-        if ovp_enable:
-            control_word |= 0x0008  # 位3：OVP功能
-        if ocp_enable:
-            control_word |= 0x0010  # 位4：OCP功能
-        # 调用通用发送函数（使用功能码0x06写单个寄存器）
-        return self._send_modbus_command(
-            function_code=0x06,
-            register=0x0005,  # 控制寄存器地址
-            value=control_word
-        )
+        return self._run(hcp1020_protocol.set_output_protections(output_on, ovp_enable, ocp_enable))
 
     #查询设置电压，电流，状态 
     def query_settings(self):
-        # 发送读取命令（起始地址0x0003，读取3个寄存器）
-        response = self._send_modbus_command(
-            function_code=0x03,
-            register=0x0003,  # 起始寄存器地址
-            read_length=3     # 读取3个寄存器（电压、电流、状态）
-        )
-        # 解析响应数据（示例响应：11 03 06 01 F4 04 B0 00 01 9D A6）
-        if response and len(response) >= 9:
-            # 提取数据部分（跳过地址、功能码和字节计数）
-            data = response[3:-2]  # 去除头尾的协议字段和CRC
-            # 解析电压（寄存器0x03）
-            voltage_reg = struct.unpack('>H', data[0:2])[0]
-            voltage = voltage_reg / 100.0  # 转换为V（10mV单位）
-            # 解析电流（寄存器0x04）
-            current_reg = struct.unpack('>H', data[2:4])[0]
-            current = current_reg / 1000.0  # 转换为A（1mA单位）
-            # 解析状态（寄存器0x05）
-            status_reg = struct.unpack('>H', data[4:6])[0]
-            return {
-                'voltage': voltage,
-                'current': current,
-                'output_on': bool(status_reg & 0x0001),  # 位0：输出状态
-                'cv_mode': bool(status_reg & 0x0002),    # 位1：恒压模式
-                'cc_mode': bool(status_reg & 0x0004)     # 位2：恒流模式
-            }
-        return None
+        return self._run(hcp1020_protocol.query_settings())
 
     # 读取实际输出电压 (0x00寄存器)
     def read_voltage(self):
-        response = self._send_modbus_command(0x03, 0x0000)
-        if len(response) >= 7:
-            return struct.unpack('>H', response[3:5])[0] / 100.0  # 转换为V
-        return None
+        return self._run(hcp1020_protocol.read_voltage())
     
     # 读取实际输出电流 (0x01寄存器)
     def read_current(self):
-        response = self._send_modbus_command(0x03, 0x0001)
-        if len(response) >= 7:
-            return struct.unpack('>H', response[3:5])[0] / 1000.0  # 转换为A
-        return None
+        return self._run(hcp1020_protocol.read_current())
     
     # 读取电源状态 (0x02寄存器)
     def read_status(self):
-        response = self._send_modbus_command(0x03, 0x0002)
-        if len(response) >= 7:
-            status_bits = struct.unpack('>H', response[3:5])[0]
-            return {
-                'output_on': bool(status_bits & 0x01),
-                'cv_mode': bool(status_bits & 0x02),
-                'cc_mode': bool(status_bits & 0x04),
-                'ovp_tripped': bool(status_bits & 0x08),
-                'ocp_tripped': bool(status_bits & 0x10),
-                'otp_tripped': bool(status_bits & 0x20)
-            }
-        return None
+        return self._run(hcp1020_protocol.read_status())
 
+    # 一次读取实际电压、电流、状态
     def query_actual_values(self):
-        # 发送读取命令（起始地址0x0000，读取3个寄存器）
-        response = self._send_modbus_command(
-            function_code=0x03,
-            register=0x0000,  # 起始寄存器地址
-            read_length=3      # 读取3个寄存器（电压、电流、状态）
-        )
-        # 解析响应数据（示例响应：11 03 06 01 F3 00 00 03 XX XX）
-        if response and len(response) >= 9:
-            # 提取数据部分（跳过地址、功能码和字节计数）
-            data = response[3:-2]  # 去除头尾的协议字段和CRC
-            # 解析实际电压（寄存器0x00）
-            voltage_reg = struct.unpack('>H', data[0:2])[0]
-            actual_voltage = voltage_reg / 100.0  # 转换为V（10mV单位）
-            # 解析实际电流（寄存器0x01）
-            current_reg = struct.unpack('>H', data[2:4])[0]
-            actual_current = current_reg / 1000.0  # 转换为A（1mA单位）
-           # 解析输出状态（寄存器0x02）
-            status_reg = struct.unpack('>H', data[4:6])[0]
-            return {
-                'voltage': actual_voltage,
-                'current': actual_current,
-                'output_status': {
-                    'output_on': bool(status_reg & 0x0001),  # 位0：输出状态
-                    'cv_mode': bool(status_reg & 0x0002),    # 位1：恒压模式
-                    'cc_mode': bool(status_reg & 0x0004),    # 位2：恒流模式
-                    'ovp_tripped': bool(status_reg & 0x0008),# 位3：OVP触发
-                    'ocp_tripped': bool(status_reg & 0x0010) # 位4：OCP触发
-                }
-            }
-        return None
+        return self._run(hcp1020_protocol.query_actual_values())
 
     # 恒功率模式设置
     def set_constant_power(self, watts):
-        # 设置线阻补偿 (0x30寄存器)
-        self._send_modbus_command(0x06, 0x0030, 100)  # 示例值
-        
-        # 设置负载阻值 (0x31寄存器)
-        self._send_modbus_command(0x06, 0x0031, 500)  # 示例值
-        
-        # 启用恒功率模式 (0x32寄存器)
-        self._send_modbus_command(0x06, 0x0032, 0x0001)
-        
-        # 设置功率值 (0x34寄存器)
-        reg_value = int(watts * 100)  # 转换为10mW单位
-        return self._send_modbus_command(0x06, 0x0034, reg_value)
+        return self._run(hcp1020_protocol.set_constant_power(watts))
     
+    # 主机侧恒功率闭环：设备没有可用的CP模式时由主机调节电压或电流设定值
+    # 在后台定时线程中运行，返回已启动的power_regulator.PowerRegulator，stop()后取report()
+    def regulate_power(self, watts, **kwargs):
+        from power_regulator import PowerRegulator
+        regulator = PowerRegulator(self, watts, **kwargs)
+        regulator.start()
+        return regulator
+
+    # 流式输出设定值波形（waveform.ramp/steps/sine/samples生成），先整体编译为预编码帧再按截止时间发送
+    # limit为物理值上限，返回waveform.stream_waveform的定时报告
+    def stream_waveform(self, waveform, limit=None, **kwargs):
+        from waveform import compile_waveform, stream_waveform
+        return stream_waveform(self, compile_waveform(waveform, self.slave_id, limit), **kwargs)
+
     # 定时输出序列
-    def execute_sequence(self, sequence):
+    def execute_sequence(self, sequence, sample_interval=None):
         """ 执行测试序列
         sequence格式: [(电压, 电流, 持续时间), ...]
+        每步按绝对单调时钟截止时间开始，通信耗时不会累积成漂移；
+        每步的电压、电流、输出开用一次0x10写入。
+        sample_interval不为None时在步内按该间隔读取实际值，只在按最近事务耗时估计下一步开始前来得及完成时才采样，
+        采样等待响应不超过下一步的开始时刻，失败时不重试。
+        返回每步的报告: planned/actual为相对序列开始的计划/实际开始时间（秒）
         """
-        for volt, curr, duration in sequence:
-            self.set_voltage(volt)
-            self.set_current(curr)
-            self.set_output(True)
-            time.sleep(duration)
-        self.set_output(False)
+        return self._run(hcp1020_protocol.execute_sequence(sequence, sample_interval, self._transaction_time))
+
     # 清除保护状态
     def clear_protections(self):
-        return self._send_modbus_command(0x06, 0x0005, 0x0040)
+        return self._run(hcp1020_protocol.clear_protections())
     
     # 键盘锁定
     def lock_keyboard(self, lock=True):
-        value = 0x4000 if lock else 0x0000
-        return self._send_modbus_command(0x06, 0x0005, value)
+        return self._run(hcp1020_protocol.lock_keyboard(lock))
 # 自动化测试脚本示例
-psu = HCP1020Controller('/dev/ttyUSB0', slave_id=1)
+if __name__ == "__main__":
+    psu = HCP1020Controller('/dev/ttyUSB0', slave_id=1)
 
-try:
-    # 设置保护参数
-    psu.set_ovp(12.0)  # 12V过压保护
-    psu.set_ocp(2.0)   # 2A过流保护
+    try:
+        # 设置保护参数
+        psu.set_ovp(12.0)  # 12V过压保护
+        psu.set_ocp(2.0)   # 2A过流保护
     
-    # 执行测试序列
-    test_sequence = [
-        (3.3, 0.5, 5),   # 3.3V@0.5A 持续5秒
-        (5.0, 1.0, 10),   # 5.0V@1.0A 持续10秒
-        (12.0, 0.2, 3)    # 12V@0.2A 持续3秒
-    ]
-    psu.execute_sequence(test_sequence)
+        # 执行测试序列
+        test_sequence = [
+            (3.3, 0.5, 5),   # 3.3V@0.5A 持续5秒
+            (5.0, 1.0, 10),   # 5.0V@1.0A 持续10秒
+            (12.0, 0.2, 3)    # 12V@0.2A 持续3秒
+        ]
+        psu.execute_sequence(test_sequence)
     
-    # 读取测试结果
-    final_voltage = psu.read_voltage()
-    final_current = psu.read_current()
-    print(f"最终读数: {final_voltage}V, {final_current}A")
+        # 读取测试结果
+        final_voltage = psu.read_voltage()
+        final_current = psu.read_current()
+        print(f"最终读数: {final_voltage}V, {final_current}A")
     
-finally:
-    psu.set_output(False)  # 确保测试结束后关闭输出
\ No newline at end of file
+    finally:
+        psu.set_output(False)  # 确保测试结束后关闭输出
+        psu.close()
\ No newline at end of file
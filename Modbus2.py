@@ -1,35 +1,53 @@
-from pymodbus.client.sync import ModbusSerialClient as ModbusClient
-from pymodbus.transaction import ModbusRtuFramer
-import serial
+import itertools
 import time
 import logging
-import re
+from batch_engine import BatchCommand, compile_commands, run_batch
+from connection_pool import default_pool
+import hcp1020_protocol
+from hcp1020_protocol import Read, Write
+from modbus_tcp import parse_tcp_url
 
-# 配置日志
-logging.basicConfig(
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# 日志格式由使用方配置，导入本模块不修改全局日志设置
 log = logging.getLogger(__name__)
 
 class PowerSupplyController:
     """通过Modbus RTU协议控制电源的类"""
     
-    def __init__(self, port, baudrate=9600, data_bits=8, parity='N', stop_bits=1, timeout=1):
-        """初始化Modbus RTU连接"""
+    def __init__(self, port, baudrate=9600, data_bits=8, parity='N', stop_bits=1, timeout=1, client=None,
+                 pool=default_pool):
+        """初始化Modbus RTU连接参数，第一次发送命令时才连接
+        client可传入现成的客户端（如hcp1020_sim.SimulatorModbusClient）；
+        否则从连接池pool借用参数相同的共享客户端，pool=None时单独创建；
+        port='tcp://host:port'时用MODBUS TCP客户端经网关（modbus_gateway.py）访问
+        """
         self.port = port
         self.baudrate = baudrate
         self.data_bits = data_bits
         self.parity = parity
         self.stop_bits = stop_bits
         self.timeout = timeout
-        self.client = None
+        self.client = client
+        self.pool = pool if client is None else None
         self.connected = False
-        
-    def connect(self):
-        """连接到电源"""
-        try:
-            self.client = ModbusClient(
+        self.instrumentation = None  # 可设置为instrumentation.Instrumentation启用计时和计数
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.disconnect()
+
+    def _pool_key(self):
+        return ('pymodbus', self.port, self.baudrate, self.data_bits, self.parity, self.stop_bits, self.timeout)
+
+    def _create_client(self):
+        tcp = parse_tcp_url(self.port)
+        if tcp is not None:
+            from pymodbus.client.sync import ModbusTcpClient  # 第一次连接时才加载pymodbus
+            client = ModbusTcpClient(tcp[0], port=tcp[1], timeout=self.timeout)
+        else:
+            from pymodbus.client.sync import ModbusSerialClient as ModbusClient
+            client = ModbusClient(
                 method='rtu',
                 port=self.port,
                 baudrate=self.baudrate,
@@ -38,7 +56,28 @@ class PowerSupplyController:
                 bytesize=self.data_bits,
                 timeout=self.timeout
             )
-            self.connected = self.client.connect()
+        if not client.connect():
+            client.close()
+            raise ConnectionError(f"无法打开 {self.port}")
+        return client
+
+    @staticmethod
+    def _client_healthy(client):
+        is_open = getattr(client, 'is_socket_open', None)
+        return is_open() if is_open is not None else True
+
+    def connect(self):
+        """连接到电源"""
+        if self.connected:
+            return True
+        try:
+            if self.pool is not None:
+                self.client = self.pool.acquire(self._pool_key(), self._create_client, self._client_healthy)
+                self.connected = True
+            else:
+                if self.client is None:
+                    self.client = self._create_client()
+                self.connected = self.client.connect()
             if self.connected:
                 log.info(f"成功连接到电源，端口: {self.port}，波特率: {self.baudrate}")
             else:
@@ -49,180 +88,182 @@ class PowerSupplyController:
             return False
     
     def disconnect(self):
-        """断开与电源的连接"""
+        """断开与电源的连接；共享客户端归还连接池，空闲超时后才真正关闭"""
         if self.connected and self.client:
-            self.client.close()
+            if self.pool is not None:
+                self.pool.release(self._pool_key(), self.client)
+                self.client = None
+            else:
+                self.client.close()
             self.connected = False
             log.info("已断开与电源的连接")
     
-    def send_raw_command(self, hex_command, unit=1):
-        """发送原始十六进制Modbus命令"""
-        if not self.connected:
+    def _execute(self, method, address, payload, unit):
+        """调用pymodbus客户端的method方法执行一次请求，失败返回None"""
+        if not self.connected and not self.connect():
             log.error("未连接到电源，无法发送命令")
             return None
-            
+        inst = self.instrumentation
+        start = time.perf_counter() if inst is not None else 0.0
+        try:
+            result = getattr(self.client, method)(address, payload, unit=unit)
+        except Exception as e:
+            log.error("发送命令异常: %s，%s 地址: 0x%04X", e, method, address)
+            if inst is not None:
+                inst.count('errors')
+            return None
+        if inst is not None:
+            inst.observe('full_frame', time.perf_counter() - start)
+        if result.isError():
+            log.error("命令执行错误: %s，%s 地址: 0x%04X", result, method, address)
+            if inst is not None:
+                inst.count('errors')
+            return None
+        # 成功日志在热路径上，使用DEBUG级别避免每次调用格式化输出
+        log.debug("命令发送成功: %s 地址: 0x%04X", method, address)
+        return result
+
+    def read_registers(self, address, count=1, unit=1):
+        """读保持寄存器(0x03)，返回寄存器值列表"""
+        result = self._execute('read_holding_registers', address, count, unit)
+        return result.registers if result is not None else None
+
+    def write_register(self, address, value, unit=1):
+        """写单个寄存器(0x06)"""
+        result = self._execute('write_register', address, value, unit)
+        return True if result is not None else None
+
+    def write_registers(self, address, values, unit=1):
+        """写多个寄存器(0x10)"""
+        result = self._execute('write_registers', address, values, unit)
+        return True if result is not None else None
+
+    def send_raw_command(self, hex_command, unit=1):
+        """发送原始十六进制Modbus命令（仅用于以文本形式给出的命令，如批量命令文件）"""
         try:
             # 解析十六进制命令
             command = bytes.fromhex(hex_command.replace(' ', ''))
-            
-            # 根据功能码选择操作
             function_code = command[1]
+            address = (command[2] << 8) | command[3]
             if function_code == 0x03:  # 读保持寄存器
-                address = (command[2] << 8) | command[3]
                 count = (command[4] << 8) | command[5]
-                result = self.client.read_holding_registers(address, count, unit=unit)
+                return self.read_registers(address, count, unit)
             elif function_code == 0x06:  # 写单个寄存器
-                address = (command[2] << 8) | command[3]
                 value = (command[4] << 8) | command[5]
-                result = self.client.write_single_register(address, value, unit=unit)
+                return self.write_register(address, value, unit)
             elif function_code == 0x10:  # 写多个寄存器
-                address = (command[2] << 8) | command[3]
-                count = (command[4] << 8) | command[5]
                 byte_count = command[6]
                 values = [(command[i+7] << 8) | command[i+8] for i in range(0, byte_count, 2)]
-                result = self.client.write_multiple_registers(address, values, unit=unit)
+                return self.write_registers(address, values, unit)
             else:
                 log.warning(f"不支持的功能码: {function_code}")
                 return None
-                
-            if not result.isError():
-                log.info(f"命令发送成功: {hex_command}")
-                # 对于读命令，返回寄存器值
-                if function_code == 0x03:
-                    return result.registers
-                return True
-            else:
-                log.error(f"命令执行错误: {result}，命令: {hex_command}")
-                return None
-        except Exception as e:
-            log.error(f"发送命令异常: {str(e)}，命令: {hex_command}")
+        except (ValueError, IndexError) as e:
+            log.error(f"命令格式错误: {str(e)}，命令: {hex_command}")
             return None
     
-    # 电源控制的具体功能（基于提供的示例）
+    # 执行hcp1020_protocol中的操作生成器，失败的请求把None送回生成器
+    def _run(self, operation, unit):
+        result = None
+        while True:
+            try:
+                step = operation.send(result)
+            except StopIteration as stop:
+                return stop.value
+            if type(step) is Read:
+                result = self.read_registers(step.register, step.count, unit)
+            elif type(step) is Write:
+                result = self.write_register(step.register, step.value, unit)
+            else:
+                result = self.write_registers(step.register, step.values, unit)
+
+    # 电源控制的具体功能（基于提供的示例），请求构造和响应解析见hcp1020_protocol中的同名函数，
+    # modbus_async.AsyncPowerSupplyController共用
     def set_voltage(self, voltage, unit=1):
         """设置输出电压"""
         # 示例1: 11 06 00 03 01 F4 (5.0V)
         # 寄存器地址0x0003，值0x01F4=500，假设精度0.01V
-        hex_value = int(voltage * 100)
-        hex_command = f"11 06 00 03 {hex_value:04X}"
-        return self.send_raw_command(hex_command, unit)
+        return self._run(hcp1020_protocol.set_voltage(voltage), unit)
     
     def set_current(self, current, unit=1):
         """设置输出电流"""
         # 示例2: 11 06 00 04 04 B0 (1.2A)
         # 寄存器地址0x0004，值0x04B0=1200，假设精度0.001A
-        hex_value = int(current * 1000)
-        hex_command = f"11 06 00 04 {hex_value:04X}"
-        return self.send_raw_command(hex_command, unit)
+        return self._run(hcp1020_protocol.set_current(current), unit)
     
     def enable_output(self, enable=True, unit=1):
         """启用或禁用电源输出"""
         # 示例3: 11 06 00 05 00 01 (开输出)
         # 寄存器地址0x0005，值0x0001=开，0x0000=关
-        value = 0x0001 if enable else 0x0000
-        hex_command = f"11 06 00 05 {value:04X}"
-        return self.send_raw_command(hex_command, unit)
+        return self._run(hcp1020_protocol.set_output(enable), unit)
     
     def set_voltage_current_output(self, voltage, current, enable=True, unit=1):
         """设定输出电压、电流并控制输出状态"""
         # 示例4: 11 10 00 03 00 03 06 01 F4 04 B0 00 01
         # 写多个寄存器，地址0x0003开始，3个寄存器
-        voltage_reg = int(voltage * 100)
-        current_reg = int(current * 1000)
-        output_reg = 0x0001 if enable else 0x0000
-        values = [voltage_reg, current_reg, output_reg]
-        hex_command = "11 10 00 03 00 03 06"
-        for val in values:
-            hex_command += f" {val:04X}"
-        return self.send_raw_command(hex_command, unit)
+        return self._run(hcp1020_protocol.set_voltage_current_output(voltage, current, enable), unit)
     
     def set_ovp_ocp(self, ovp_voltage, ocp_current, unit=1):
         """设定过压保护值和过流保护值"""
         # 示例5: 11 10 00 06 00 02 04 07 D0 0C 80
         # 写多个寄存器，地址0x0006开始，2个寄存器
-        ovp_reg = int(ovp_voltage * 100)
-        ocp_reg = int(ocp_current * 1000)
-        values = [ovp_reg, ocp_reg]
-        hex_command = "11 10 00 06 00 02 04"
-        for val in values:
-            hex_command += f" {val:04X}"
-        return self.send_raw_command(hex_command, unit)
+        return self._run(hcp1020_protocol.set_protection_values(ovp_voltage, ocp_current), unit)
     
     def query_voltage_current_status(self, unit=1):
         """查询设置电压、电流和状态"""
         # 示例7: 11 03 00 03 00 03
         # 读3个寄存器，地址0x0003开始
-        hex_command = "11 03 00 03 00 03"
-        registers = self.send_raw_command(hex_command, unit)
-        if registers:
-            voltage = registers[0] / 100  # 假设精度0.01V
-            current = registers[1] / 1000  # 假设精度0.001A
-            status = "ON" if registers[2] == 1 else "OFF"
-            return {"voltage": voltage, "current": current, "status": status}
-        return None
+        return self._run(hcp1020_protocol.query_voltage_current_status(), unit)
     
     def query_voltage_display(self, unit=1):
         """查询电压显示值"""
         # 示例8: 11 03 00 00 00 01
         # 读1个寄存器，地址0x0000
-        hex_command = "11 03 00 00 00 01"
-        registers = self.send_raw_command(hex_command, unit)
-        if registers:
-            return registers[0] / 100  # 假设精度0.01V
-        return None
+        return self._run(hcp1020_protocol.query_voltage_display(), unit)
     
     def query_current_display(self, unit=1):
         """查询电流显示值"""
         # 示例9: 11 03 00 01 00 01
         # 读1个寄存器，地址0x0001
-        hex_command = "11 03 00 01 00 01"
-        registers = self.send_raw_command(hex_command, unit)
-        if registers:
-            return registers[0] / 1000  # 假设精度0.001A
-        return None
+        return self._run(hcp1020_protocol.query_current_display(), unit)
     
     def query_output_status(self, unit=1):
         """查询输出状态"""
         # 示例10: 11 03 00 02 00 01
         # 读1个寄存器，地址0x0002
-        hex_command = "11 03 00 02 00 01"
-        registers = self.send_raw_command(hex_command, unit)
-        if registers:
-            return "ON" if registers[0] == 1 else "OFF"
-        return None
+        return self._run(hcp1020_protocol.query_output_status(), unit)
     
     def query_voltage_current_status_display(self, unit=1):
         """查询电压、电流和输出状态显示值"""
         # 示例11: 11 03 00 00 00 03
         # 读3个寄存器，地址0x0000开始
-        hex_command = "11 03 00 00 00 03"
-        registers = self.send_raw_command(hex_command, unit)
-        if registers:
-            voltage = registers[0] / 100  # 假设精度0.01V
-            current = registers[1] / 1000  # 假设精度0.001A
-            status = "ON" if registers[2] == 1 else "OFF"
-            return {"voltage": voltage, "current": current, "status": status}
-        return None
+        return self._run(hcp1020_protocol.query_voltage_current_status_display(), unit)
 
 # 批量发送命令示例
-def batch_send_commands(controller, commands, unit=1):
-    """批量发送命令"""
-    results = []
-    for cmd in commands:
-        # 解析命令格式: 1=1|1000|1|设置电压5.0V|11 06 00 03 01 F4
-        match = re.match(r'(\d+)=(\d+)\|(\d+)\|(\d+)\|(.*)\|(.*)', cmd)
-        if match:
-            idx, slave_addr, baudrate, data_bits, desc, hex_cmd = match.groups()
-            # 注意：示例中的波特率1000可能是笔误，通常为9600、115200等
-            # 此处强制使用控制器的波特率，如需动态设置可修改
-            log.info(f"执行命令 {idx}: {desc}")
-            result = controller.send_raw_command(hex_cmd, int(slave_addr))
-            results.append((desc, result))
-            time.sleep(0.5)  # 命令间隔
-    return results
+def batch_send_commands(controller, commands, unit=1, *, min_interval=0.0):
+    """批量发送命令
+    commands可以是命令文本行（格式: 1=1|1000|1|设置电压5.0V|11 06 00 03 01 F4，从站地址取自每行），
+    也可以是编译好的命令：batch_engine.compile_batch的计划（可重复执行）或iter_batch_file等生成器。
+    相邻寄存器的连续写入合并为一次0x10写入，收到响应后立即发送下一条。
+    unit: 保留以兼容原有调用，不起作用，从站地址总是取自每条命令
+    min_interval: 相邻命令之间的最小间隔（秒），默认不等待
+    """
+    # 按第一项判断是文本行还是编译好的命令，生成器只能遍历一次，取出的第一项再接回去
+    commands = iter(commands)
+    first = next(commands, None)
+    if first is None:
+        return []
+    commands = itertools.chain([first], commands)
+    if not isinstance(first, BatchCommand):
+        commands = compile_commands(commands)
+    return [(r.description, r.result) for r in run_batch(controller, commands, min_interval)]
 
 # 使用示例
 if __name__ == "__main__":
+    logging.basicConfig(
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
     # 根据实际情况修改串口参数
     power_supply = PowerSupplyController(
         port='COM3',  # Windows串口，Linux/Mac为'/dev/ttyUSB0'
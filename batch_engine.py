@@ -0,0 +1,129 @@
+import logging
+import re
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+# 批量命令引擎：命令文本只解析校验一次，编译为可重复执行的计划
+# 命令格式: 序号=从站地址|波特率|数据位|描述|十六进制命令，例如 1=1|1000|1|设置电压5.0V|11 06 00 03 01 F4
+
+COMMAND_PATTERN = re.compile(r'(\d+)=(\d+)\|(\d+)\|(\d+)\|(.*)\|(.*)')
+MAX_WRITE_REGISTERS = 123  # 0x10单次最多写入的寄存器数
+
+# indexes/descriptions为元组：相邻写入合并后一条命令对应多条原始命令
+# payload: 0x03为读取数量，0x06/0x10为寄存器值列表；error不为None表示命令无效
+BatchCommand = namedtuple('BatchCommand',
+                          ['indexes', 'unit', 'descriptions', 'function_code', 'address', 'payload', 'error'])
+BatchResult = namedtuple('BatchResult', ['index', 'description', 'result', 'elapsed', 'merged'])
+
+
+def _decode_hex(hex_cmd):
+    command = bytes.fromhex(hex_cmd.replace(' ', ''))
+    if len(command) < 6:
+        raise ValueError("命令长度不足")
+    function_code = command[1]
+    address = (command[2] << 8) | command[3]
+    if function_code == 0x03:
+        return function_code, address, (command[4] << 8) | command[5]
+    if function_code == 0x06:
+        return function_code, address, [(command[4] << 8) | command[5]]
+    if function_code == 0x10:
+        count = (command[4] << 8) | command[5]
+        if len(command) < 7 or command[6] != count * 2 or len(command) < 7 + count * 2:
+            raise ValueError("寄存器数量与数据长度不符")
+        return function_code, address, [(command[i] << 8) | command[i + 1] for i in range(7, 7 + count * 2, 2)]
+    raise ValueError(f"不支持的功能码: {function_code}")
+
+
+# 解析一行命令，不符合格式的行返回None；strict=True时十六进制错误抛出ValueError
+def parse_command(line, strict=False):
+    match = COMMAND_PATTERN.match(line)
+    if not match:
+        return None
+    idx, slave_addr, baudrate, data_bits, desc, hex_cmd = match.groups()
+    # 注意：示例中的波特率1000可能是笔误，此处统一使用控制器的串口设置
+    try:
+        function_code, address, payload = _decode_hex(hex_cmd)
+        error = None
+    except ValueError as e:
+        if strict:
+            raise ValueError(f"命令{idx}格式错误: {e}") from e
+        log.warning("命令%s格式错误: %s，命令: %s", idx, e, hex_cmd)
+        function_code = address = payload = None
+        error = str(e)
+    return BatchCommand((int(idx),), int(slave_addr), (desc,), function_code, address, payload, error)
+
+
+def _can_merge(first, second):
+    return (first.error is None and second.error is None
+            and first.unit == second.unit
+            and first.function_code in (0x06, 0x10) and second.function_code in (0x06, 0x10)
+            and second.address == first.address + len(first.payload)
+            and len(first.payload) + len(second.payload) <= MAX_WRITE_REGISTERS)
+
+
+def _merge(first, second):
+    return BatchCommand(first.indexes + second.indexes, first.unit,
+                        first.descriptions + second.descriptions,
+                        0x10, first.address, first.payload + second.payload, None)
+
+
+# 逐行编译命令（生成器，适合流式处理大文件）；merge=True时把相邻寄存器的连续写入合并为一次0x10写入
+def compile_commands(lines, strict=False, merge=True):
+    pending = None
+    for line in lines:
+        command = parse_command(line.strip(), strict)
+        if command is None:
+            continue
+        if merge and pending is not None and _can_merge(pending, command):
+            pending = _merge(pending, command)
+            continue
+        if pending is not None:
+            yield pending
+        pending = command
+    if pending is not None:
+        yield pending
+
+
+# 编译为可重复执行的计划
+def compile_batch(lines, strict=False, merge=True):
+    return list(compile_commands(lines, strict, merge))
+
+
+# 流式读取命令文件，不一次性载入整个文件
+def iter_batch_file(path, strict=False, merge=True, encoding='utf-8'):
+    with open(path, encoding=encoding) as f:
+        yield from compile_commands(f, strict, merge)
+
+
+def _send(controller, command):
+    if command.error is not None:
+        return None
+    if command.function_code == 0x03:
+        return controller.read_registers(command.address, command.payload, command.unit)
+    if command.function_code == 0x06:
+        return controller.write_register(command.address, command.payload[0], command.unit)
+    return controller.write_registers(command.address, command.payload, command.unit)
+
+
+# 执行计划，逐条产生结果。控制器在收到响应后才返回，下一条命令随即发送，
+# 不再固定等待；min_interval可为需要额外间隔的设备设置最小命令间隔（秒）
+def execute_batch(controller, commands, min_interval=0.0):
+    last = None
+    for command in commands:
+        if min_interval and last is not None:
+            delay = last + min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        log.info("执行命令 %s: %s", command.indexes, command.descriptions)
+        start = time.perf_counter()
+        result = _send(controller, command)
+        elapsed = time.perf_counter() - start
+        last = time.monotonic()
+        for index, description in zip(command.indexes, command.descriptions):
+            yield BatchResult(index, description, result, elapsed, len(command.indexes))
+
+
+def run_batch(controller, commands, min_interval=0.0):
+    return list(execute_batch(controller, commands, min_interval))
@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import time
+
+from hcp1020_sim import HCP1020Simulator, SimulatedSerial, SimulatorModbusClient
+from instrumentation import percentile
+from Modbus import HCP1020Controller
+from modbus_rtu import build_request
+from Modbus2 import PowerSupplyController, batch_send_commands
+
+# 控制器事务基准：在模拟链路上运行标准工作负载，输出延时分位数、每秒命令数和线上字节数（JSON）
+
+BATCH_COMMANDS = [
+    "1=1|1000|1|设置电压5.0V|11 06 00 03 01 F4",
+    "2=1|1000|1|设置电流1.2A|11 06 00 04 04 B0",
+    "3=1|1000|1|开输出|11 06 00 05 00 19",
+    "4=1|1000|1|设定过压过流保护|11 10 00 06 00 02 04 07 D0 0C 80",
+    "7=1|1000|1|查询设置电压，电流，状态|11 03 00 03 00 03",
+    "8=1|1000|1|查询电压显示|11 03 00 00 00 01",
+    "9=1|1000|1|查询电流显示|11 03 00 01 00 01",
+    "10=1|1000|1|查询输出状态|11 03 00 02 00 01",
+]
+
+SEQUENCE = [(3.3, 0.5, 0.0), (5.0, 1.0, 0.0), (12.0, 0.2, 0.0)] * 4
+
+
+def run_workload(name, port, func, iterations, commands_per_call=1):
+    latencies = []
+    bytes_before = port.stats['bytes_written'] + port.stats['bytes_read']
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    wire_bytes = port.stats['bytes_written'] + port.stats['bytes_read'] - bytes_before
+    commands = iterations * commands_per_call
+    return {
+        'workload': name,
+        'iterations': iterations,
+        'commands': commands,
+        'elapsed': elapsed,
+        'commands_per_second': commands / elapsed if elapsed else 0.0,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': latencies[-1] if latencies else 0.0,
+        'bytes_on_wire': wire_bytes,
+        'bytes_per_command': wire_bytes / commands if commands else 0.0
+    }
+
+
+def _port(args):
+    return SimulatedSerial(HCP1020Simulator(slave_id=1), baudrate=args.baudrate,
+                           response_delay=args.response_delay, realtime=not args.no_realtime, seed=0)
+
+
+def bench_hcp1020(args):
+    port = _port(args)
+    psu = HCP1020Controller(port, slave_id=1, baudrate=args.baudrate)
+    n = args.iterations
+    frame = build_request(1, 0x06, 0x0003, 500)  # 预编码的设定5.0V帧，对比热路径上省去的编码开销
+    return [
+        run_workload('hcp1020.set_voltage', port, lambda: psu.set_voltage(5.0), n),
+        run_workload('hcp1020.send_frame', port, lambda: psu.send_frame(frame, 0x06, 0x0003, 500), n),
+        run_workload('hcp1020.query_actual_values', port, psu.query_actual_values, n),
+        run_workload('hcp1020.execute_sequence', port, lambda: psu.execute_sequence(SEQUENCE),
+                     max(1, n // 20), len(SEQUENCE) + 1),
+    ]
+
+
+def bench_power_supply(args):
+    port = _port(args)
+    psu = PowerSupplyController('sim', client=SimulatorModbusClient(port))
+    psu.connect()
+    n = args.iterations
+    return [
+        run_workload('power_supply.set_voltage', port, lambda: psu.set_voltage(5.0), n),
+        run_workload('power_supply.query_voltage_current_status_display', port,
+                     psu.query_voltage_current_status_display, n),
+        run_workload('power_supply.batch_send_commands', port,
+                     lambda: batch_send_commands(psu, BATCH_COMMANDS), max(1, n // 10), len(BATCH_COMMANDS)),
+    ]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="控制器事务吞吐与延时基准")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--response-delay', type=float, default=0.0005, help="模拟设备处理时间（秒）")
+    parser.add_argument('--no-realtime', action='store_true', help="不模拟串口传输时间，只测主机侧开销")
+    parser.add_argument('--output', help="JSON结果文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    logging.getLogger('Modbus2').setLevel(logging.WARNING)
+    logging.getLogger('batch_engine').setLevel(logging.WARNING)
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'baudrate': args.baudrate,
+        'response_delay': args.response_delay,
+        'realtime': not args.no_realtime,
+        'results': bench_hcp1020(args) + bench_power_supply(args)
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# 导入耗时基准：每个模块在全新的解释器中导入，用 -X importtime 取模块自身的累计导入时间，
+# 同时检查导入后是否加载了重量级依赖（pyserial/pymodbus/NumPy应在第一次使用时才加载）
+
+MODULES = [
+    'crc16', 'register_map', 'modbus_rtu', 'Modbus', 'Modbus2', 'modbus_async', 'rs485_bus',
+    'fleet', 'batch_engine', 'telemetry_stream', 'telemetry_recorder', 'instrumentation',
+    'connection_pool', 'hcp1020_sim', 'modbus_tcp', 'modbus_gateway',
+    'power_regulator', 'waveform', 'hcp1020_protocol', 'realtime'
+]
+
+HEAVY_MODULES = ('serial', 'pymodbus', 'numpy')
+
+PROBE = ("import sys, json; import {module}; "
+         "print(json.dumps([m for m in {heavy!r} if m in sys.modules]))")
+
+
+# 解析 -X importtime 输出中module那一行的累计时间（微秒）
+def _cumulative_us(stderr, module):
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1])
+    return None
+
+
+def measure(module, repeat):
+    cumulative = []
+    wall = []
+    heavy = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                               PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                              capture_output=True, text=True)
+        wall.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1]}
+        cumulative.append(_cumulative_us(proc.stderr, module) / 1e6)
+        heavy = json.loads(proc.stdout)
+    return {
+        'module': module,
+        'import_time': statistics.median(cumulative),
+        'import_time_min': min(cumulative),
+        'process_time': statistics.median(wall),
+        'heavy_modules_loaded': heavy
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模块导入耗时基准")
+    parser.add_argument('modules', nargs='*', default=MODULES, help="要测量的模块，默认全部")
+    parser.add_argument('--repeat', type=int, default=5, help="每个模块在新进程中导入的次数，取中位数")
+    parser.add_argument('--budget', type=float, help="导入时间上限（毫秒），超出时返回非零")
+    parser.add_argument('--output', help="JSON结果文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    report = {
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    # 导入失败、加载了重量级依赖或超出预算时返回非零，可直接用于CI
+    failed = [r['module'] for r in results if 'error' in r or r['heavy_modules_loaded']
+              or (args.budget is not None and r['import_time'] * 1000 > args.budget)]
+    if failed:
+        print(f"超出导入预算或加载了重量级依赖: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
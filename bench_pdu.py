@@ -0,0 +1,112 @@
+import logging
+import time
+
+from Modbus2 import PowerSupplyController, log
+
+# 基准：PowerSupplyController 原十六进制字符串路径 vs 直接寄存器路径的单次调用开销
+# 使用不访问串口的空客户端，只测量本模块自身的开销；原路径按修改前的send_raw_command原样复制在下面
+
+
+class _Result:
+    def __init__(self, registers=None):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class NullClient:
+    """立即返回成功结果的客户端"""
+
+    def read_holding_registers(self, address, count, unit=1):
+        return _Result([0] * count)
+
+    def write_register(self, address, value, unit=1):
+        return _Result()
+
+    def write_registers(self, address, values, unit=1):
+        return _Result()
+
+    # 修改前send_raw_command调用的方法名
+    write_single_register = write_register
+    write_multiple_registers = write_registers
+
+
+# 修改前的PowerSupplyController.send_raw_command：每次调用都解析十六进制字符串、记录日志
+def baseline_send_raw_command(psu, hex_command, unit=1):
+    if not psu.connected:
+        log.error("未连接到电源，无法发送命令")
+        return None
+    try:
+        command = bytes.fromhex(hex_command.replace(' ', ''))
+        function_code = command[1]
+        if function_code == 0x03:
+            address = (command[2] << 8) | command[3]
+            count = (command[4] << 8) | command[5]
+            result = psu.client.read_holding_registers(address, count, unit=unit)
+        elif function_code == 0x06:
+            address = (command[2] << 8) | command[3]
+            value = (command[4] << 8) | command[5]
+            result = psu.client.write_single_register(address, value, unit=unit)
+        elif function_code == 0x10:
+            address = (command[2] << 8) | command[3]
+            byte_count = command[6]
+            values = [(command[i+7] << 8) | command[i+8] for i in range(0, byte_count, 2)]
+            result = psu.client.write_multiple_registers(address, values, unit=unit)
+        else:
+            log.warning(f"不支持的功能码: {function_code}")
+            return None
+        if not result.isError():
+            log.info(f"命令发送成功: {hex_command}")
+            if function_code == 0x03:
+                return result.registers
+            return True
+        log.error(f"命令执行错误: {result}，命令: {hex_command}")
+        return None
+    except Exception as e:
+        log.error(f"发送命令异常: {str(e)}，命令: {hex_command}")
+        return None
+
+
+# 修改前的调用方式：格式化十六进制字符串后交给send_raw_command解析
+def hex_set_voltage(psu, voltage):
+    return baseline_send_raw_command(psu, f"11 06 00 03 {int(voltage * 100):04X}")
+
+
+def hex_set_voltage_current_output(psu, voltage, current):
+    hex_command = "11 10 00 03 00 03 06"
+    for val in [int(voltage * 100), int(current * 1000), 1]:
+        hex_command += f" {val:04X}"
+    return baseline_send_raw_command(psu, hex_command)
+
+
+def hex_query_display(psu):
+    return baseline_send_raw_command(psu, "11 03 00 00 00 03")
+
+
+def measure(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+if __name__ == "__main__":
+    logging.getLogger('Modbus2').setLevel(logging.WARNING)  # 排除日志输出的影响
+    psu = PowerSupplyController('null')
+    psu.client = NullClient()
+    psu.connected = True
+
+    number = 100000
+    cases = [
+        ('set_voltage', lambda: hex_set_voltage(psu, 5.0), lambda: psu.set_voltage(5.0)),
+        ('set_voltage_current_output', lambda: hex_set_voltage_current_output(psu, 5.0, 1.2),
+         lambda: psu.set_voltage_current_output(5.0, 1.2, True)),
+        ('query_voltage_current_status_display', lambda: hex_query_display(psu),
+         lambda: psu.query_voltage_current_status_display()),
+    ]
+    for name, before, after in cases:
+        t_before = measure(before, number)
+        t_after = measure(after, number)
+        print(f"{name}: 十六进制路径 {t_before * 1e6:.2f} us/次, 直接路径 {t_after * 1e6:.2f} us/次, "
+              f"{1 / t_after:.0f} 次/秒上限")
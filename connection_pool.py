@@ -0,0 +1,166 @@
+import threading
+import time
+
+# 进程内连接池：同一串口、同一组串口参数的连接只打开一次，由多个控制器共享
+# 引用计数归零后连接保持打开，空闲超过idle_timeout才关闭；借出前做健康检查，失效的连接重新打开，
+# 仍被借出的失效连接在最后一次归还时关闭。打开连接不持有池锁，只阻塞同一key的其他借用者
+# 每个连接带一把锁（connection_lock()），共用连接的借用者用它串行执行事务，避免请求和响应帧交错
+
+
+class _Entry:
+    def __init__(self, connection, closer):
+        self.connection = connection
+        self.closer = closer
+        self.refs = 0
+        self.idle_since = None
+        self.opened = threading.Event()  # 未设置时connection正在打开
+        self.lock = threading.RLock()     # 借用者共用的事务锁
+
+
+class ConnectionPool:
+    """按key共享连接，acquire()/release()成对调用"""
+
+    def __init__(self, idle_timeout=30.0):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stale = {}  # id(连接) -> 已从池中移除、仍被借出的失效连接
+        self._reaper = None
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0, 'unhealthy': 0}
+
+    # 借出key对应的连接；不存在或健康检查失败时用factory()打开新连接
+    # check(connection)返回False表示连接已失效；closer(connection)关闭连接，默认调用close()
+    def acquire(self, key, factory, check=None, closer=None):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    # 占位后在锁外打开，同一key的其他借用者等待打开完成
+                    entry = self._entries[key] = _Entry(None, closer)
+                    break
+                if entry.opened.is_set():
+                    if check is None or check(entry.connection):
+                        self.stats['reused'] += 1
+                        entry.refs += 1
+                        entry.idle_since = None
+                        return entry.connection
+                    self.stats['unhealthy'] += 1
+                    self._retire(key, entry)
+                    continue
+                opened = entry.opened
+            opened.wait()  # 打开失败时占位已移除，重新尝试
+
+        try:
+            connection = factory()
+        except BaseException:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                entry.opened.set()
+            raise
+        with self._lock:
+            entry.connection = connection
+            entry.refs = 1
+            entry.opened.set()
+            self.stats['opened'] += 1
+            if self._entries.get(key) is not entry:
+                self._stale[id(connection)] = entry  # 打开期间调用了close_all()
+        return connection
+
+    # 借出的连接对应的事务锁，所有借用同一连接的控制器必须在持有该锁时收发
+    def connection_lock(self, key, connection):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.connection is not connection:
+                entry = self._stale.get(id(connection))
+            if entry is None:
+                raise KeyError(f"连接不属于连接池: {key}")
+            return entry.lock
+
+    # 从池中移除失效的连接：未借出的立即关闭，仍被借出的在最后一次release()时关闭
+    def _retire(self, key, entry):
+        del self._entries[key]
+        if entry.refs:
+            self._stale[id(entry.connection)] = entry
+        else:
+            self._close(entry)
+
+    # 归还连接；引用计数归零后开始计算空闲时间
+    # connection为借出的连接，传入时可以归还已被替换的失效连接
+    def release(self, key, connection=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if connection is not None and (entry is None or entry.connection is not connection):
+                entry = self._stale.get(id(connection))
+                if entry is not None:
+                    entry.refs -= 1
+                    if not entry.refs:
+                        del self._stale[id(connection)]
+                        self._close(entry)
+                return
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            if entry.refs:
+                return
+            entry.idle_since = time.monotonic()
+            if self.idle_timeout <= 0:
+                del self._entries[key]
+                self._close(entry)
+            elif self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name='connection-pool-reaper', daemon=True)
+                self._reaper.start()
+
+    # 关闭空闲超时的连接，返回关闭的数量
+    def reap(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._reap_locked(now)
+
+    def _reap_locked(self, now):
+        expired = [key for key, entry in self._entries.items()
+                   if entry.idle_since is not None and now - entry.idle_since >= self.idle_timeout]
+        for key in expired:
+            self._close(self._entries.pop(key))
+        return len(expired)
+
+    # 后台线程：有空闲连接时定期回收，没有空闲连接后退出
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 0.01))
+            with self._lock:
+                self._reap_locked(time.monotonic())
+                if not any(entry.idle_since is not None for entry in self._entries.values()):
+                    self._reaper = None
+                    return
+
+    def _close(self, entry):
+        self.stats['closed'] += 1
+        try:
+            if entry.closer is not None:
+                entry.closer(entry.connection)
+            else:
+                entry.connection.close()
+        except Exception:
+            pass  # 关闭失败的连接直接丢弃
+
+    # 关闭全部连接（包括仍被借出的），用于进程退出或测试之间
+    def close_all(self):
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.opened.is_set()]
+            entries.extend(self._stale.values())
+            self._entries.clear()
+            self._stale.clear()
+            for entry in entries:
+                self._close(entry)
+
+    # 当前连接：{key: (引用计数, 空闲秒数或None)}
+    def connections(self):
+        now = time.monotonic()
+        with self._lock:
+            return {key: (entry.refs, now - entry.idle_since if entry.idle_since is not None else None)
+                    for key, entry in self._entries.items() if entry.opened.is_set()}
+
+
+# 进程级默认连接池，控制器默认从这里借用串口/客户端
+default_pool = ConnectionPool()
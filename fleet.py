@@ -0,0 +1,104 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from Modbus import HCP1020Controller
+from rs485_bus import RS485Bus
+
+# 多串口并行下发：一次把同一设定值/查询下发到整个机架的电源
+# 每个串口一个长连接；同一串口上的多个从站通过RS485Bus共享，不同串口在线程池中并行执行
+
+FleetResult = namedtuple('FleetResult', ['port', 'slave_id', 'ok', 'value', 'error', 'elapsed'])
+
+
+class FleetManager:
+    """devices为 [(串口, 从站地址), ...]，构造时打开全部串口并保持连接直到close()
+
+    打开失败的设备记录在open_errors中，不参与下发，每次apply()的结果中报告为失败
+    """
+
+    def __init__(self, devices, baudrate=9600, timeout=1, **controller_kwargs):
+        self.controllers = {}   # (串口, 从站地址) -> 控制器
+        self.open_errors = {}   # 打开失败的设备 -> 异常
+        self.buses = []
+        by_port = {}
+        for port, slave_id in devices:
+            by_port.setdefault(port, []).append(slave_id)
+        for port, slave_ids in by_port.items():
+            try:
+                if len(slave_ids) == 1:
+                    controller = HCP1020Controller(port, slave_ids[0], baudrate, timeout, **controller_kwargs)
+                    controller.ser  # 控制器默认在第一次通信时才打开串口，这里提前打开
+                    self.controllers[(port, slave_ids[0])] = controller
+                else:
+                    bus = RS485Bus(port, baudrate, timeout)
+                    self.buses.append(bus)
+                    for slave_id in slave_ids:
+                        self.controllers[(port, slave_id)] = bus.slave(slave_id, **controller_kwargs)
+            except Exception as e:
+                for slave_id in slave_ids:
+                    self.open_errors[(port, slave_id)] = e
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.controllers)),
+                                            thread_name_prefix='fleet')
+        self.last_wall_time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _call(self, key, method, args, kwargs):
+        start = time.perf_counter()
+        try:
+            value = getattr(self.controllers[key], method)(*args, **kwargs)
+            return FleetResult(key[0], key[1], True, value, None, time.perf_counter() - start)
+        except Exception as e:
+            return FleetResult(key[0], key[1], False, None, e, time.perf_counter() - start)
+
+    # 在所有设备上并行调用控制器方法，返回 {(串口, 从站地址): FleetResult}
+    def apply(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        futures = {key: self._executor.submit(self._call, key, method, args, kwargs)
+                   for key in self.controllers}
+        results = {key: future.result() for key, future in futures.items()}
+        for key, error in self.open_errors.items():
+            results[key] = FleetResult(key[0], key[1], False, None, error, 0.0)
+        self.last_wall_time = time.perf_counter() - start
+        return results
+
+    def set_voltage_current_output(self, volts, amps, output_state):
+        return self.apply('set_voltage_current_output', volts, amps, output_state)
+
+    def set_protection_values(self, ovp_volts, ocp_amps):
+        return self.apply('set_protection_values', ovp_volts, ocp_amps)
+
+    def set_output(self, state):
+        return self.apply('set_output', state)
+
+    def query_actual_values(self):
+        return self.apply('query_actual_values')
+
+    # 失败的设备：调用异常或无响应（返回空/None）
+    @staticmethod
+    def failures(results):
+        return {key: r for key, r in results.items() if not r.ok or not r.value}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for controller in self.controllers.values():
+            controller.close()  # 总线句柄的close()不做任何事，串口随总线关闭
+        for bus in self.buses:
+            bus.close()
+
+
+# 使用示例：老化机架上的40台电源同时设定
+if __name__ == "__main__":
+    devices = [(f'/dev/ttyUSB{i}', 1) for i in range(40)]
+    with FleetManager(devices, baudrate=9600) as fleet:
+        results = fleet.set_voltage_current_output(12.0, 1.0, True)
+        print(f"设定完成，总耗时 {fleet.last_wall_time * 1000:.1f} ms")
+        for key, result in fleet.failures(results).items():
+            print(f"失败: {key} {result.error}")
+        for key, result in sorted(fleet.query_actual_values().items()):
+            print(key, result.value)
@@ -0,0 +1,373 @@
+import time
+from collections import deque, namedtuple
+
+from crc16 import check_crc
+from modbus_rtu import (build_read_response, build_write_response, decode_registers, expected_response_length,
+                        iter_frames, plan_register_reads, validate_response, TELEMETRY_BLOCKS,
+                        ModbusError, ModbusExceptionResponse)
+from register_map import (register_address, to_raw, from_raw, decode_bits, encode_bits, decode_status,
+                          decode_telemetry, STATUS_BITS, CONTROL_BITS, CONTROL_MASKS, STATUS_MASKS, TRIP_BITS)
+
+# HCP1020的命令层，与IO无关，同步和异步控制器共用一份实现：
+# 每个操作写成生成器，产出要执行的步骤（读寄存器、写寄存器、等待），控制器用各自的IO执行后把结果送回生成器，
+# 通信失败时把ModbusError抛回生成器。HCP1020Controller/AsyncHCP1020Controller失败时抛出异常，
+# PowerSupplyController/AsyncPowerSupplyController失败时把None送回。
+# HCP1020Protocol是两个HCP1020控制器共用的状态：影子缓存、重试策略、重新同步和延时统计
+
+# deadline: 单调时钟时刻，不为None时等待响应不超过该时刻，也不在该时刻前来不及完成时重试
+Read = namedtuple('Read', ['register', 'count', 'deadline'], defaults=[None])  # 0x03，结果为寄存器值序列
+Write = namedtuple('Write', ['register', 'value'])                # 0x06
+WriteMultiple = namedtuple('WriteMultiple', ['register', 'values'])  # 0x10
+Sleep = namedtuple('Sleep', ['deadline'])                         # 等待到单调时钟的绝对时刻
+
+# 会自行变化的寄存器（实际电压、电流、状态），不进入影子缓存
+VOLATILE_REGISTERS = frozenset([register_address('voltage'), register_address('current'), register_address('status')])
+STATUS_REGISTER = register_address('status')
+CONTROL_REGISTER = register_address('control')
+CLEAR_PROTECTION_BIT = CONTROL_MASKS['clear_protection']
+# 重发后可能成功的异常响应：从站忙、网关报告从站无响应
+RETRY_EXCEPTION_CODES = frozenset([0x06, 0x0B])
+RECENT_TRANSACTIONS = 32  # 估计事务耗时所用的最近事务数
+
+
+class HCP1020Protocol:
+    """HCP1020控制器与IO无关的部分，子类实现_command/_exchange/_transact"""
+
+    def _init_state(self, slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                    retry_backoff_max):
+        self.slave_id = slave_id
+        self.max_read_registers = max_read_registers  # 设备单次读寄存器的最大数量
+        self.reset_latency_stats()
+        self._init_shadow(shadow, shadow_ttl)
+        self.instrumentation = None  # 可设置为instrumentation.Instrumentation启用分阶段计时
+        # 响应校验失败时的重试次数和退避时间（秒，每次翻倍，不超过retry_backoff_max）
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+
+    # 第attempt次（从0起）请求失败后重发前的等待时间；不应重试或重试来不及在deadline前完成时重新抛出error
+    def _retry_delay(self, error, attempt, deadline=None):
+        if attempt >= self.retries:
+            raise error
+        if isinstance(error, ModbusExceptionResponse) and error.exception_code not in RETRY_EXCEPTION_CODES:
+            raise error
+        delay = min(self.retry_backoff * 2 ** attempt, self.retry_backoff_max)
+        if deadline is not None and time.monotonic() + delay + self._transaction_time() >= deadline:
+            raise error
+        if self.instrumentation is not None:
+            self.instrumentation.count('retries')
+        return delay
+
+    # 过期响应或干扰字节：从data（响应加线路上剩余的字节）中找属于本次请求的帧，找不到返回None
+    def _resync(self, data, function_code, register, value, count):
+        for frame in iter_frames(data, self.slave_id, function_code):
+            try:
+                validate_response(frame, self.slave_id, function_code, register, value, count)
+            except ModbusError:
+                continue
+            if self.instrumentation is not None:
+                self.instrumentation.count('resyncs')
+            return frame
+        return None
+
+    # 按响应内容计数超时、不完整帧和CRC错误
+    def _count_response(self, response):
+        inst = self.instrumentation
+        if not response:
+            inst.count('timeouts')
+        elif len(response) < 3 or len(response) != expected_response_length(response):
+            inst.count('incomplete_frames')
+        elif not check_crc(response):
+            inst.count('crc_failures')
+
+    def _record_latency(self, elapsed, response):
+        stats = self.stats
+        stats['transactions'] += 1
+        stats['total_time'] += elapsed
+        stats['last_time'] = elapsed
+        self._recent_times.append(elapsed)
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        if stats['min_time'] is None or elapsed < stats['min_time']:
+            stats['min_time'] = elapsed
+        if len(response) < 3 or len(response) != expected_response_length(response):
+            stats['incomplete'] += 1
+
+    # 返回事务延时统计，包含平均值和每秒事务数
+    def latency_stats(self):
+        stats = dict(self.stats)
+        count = stats['transactions']
+        stats['avg_time'] = stats['total_time'] / count if count else 0.0
+        stats['commands_per_second'] = count / stats['total_time'] if stats['total_time'] else 0.0
+        return stats
+
+    # 事务延时统计（秒）
+    def reset_latency_stats(self):
+        self.stats = {
+            'transactions': 0,
+            'incomplete': 0,   # 超时或帧不完整的次数
+            'total_time': 0.0,
+            'min_time': None,
+            'max_time': 0.0,
+            'last_time': 0.0
+        }
+        self._recent_times = deque(maxlen=RECENT_TRANSACTIONS)
+
+    # 一次事务的预计耗时：最近事务耗时的第90百分位，偶发的超时不会长期抬高估计
+    def _transaction_time(self):
+        if not self._recent_times:
+            return 0.0
+        recent = sorted(self._recent_times)
+        return recent[int(len(recent) * 0.9)]
+
+    # 影子寄存器：记录本控制器写入或读到的保持寄存器值 {地址: (值, 时间)}
+    # 超过shadow_ttl秒的记录视为失效，既不用于跳过写入，也不用于应答读取
+    def _init_shadow(self, enabled, ttl):
+        self.shadow = {} if enabled else None
+        self.shadow_ttl = ttl
+        self.shadow_stats = {'skipped_writes': 0, 'cached_reads': 0}
+
+    def invalidate_shadow(self, registers=None):
+        if self.shadow is None:
+            return
+        if registers is None:
+            self.shadow.clear()
+        else:
+            for register in registers:
+                self.shadow.pop(register, None)
+
+    def _shadow_value(self, register, now):
+        entry = self.shadow.get(register)
+        if entry is None or now - entry[1] > self.shadow_ttl:
+            return None
+        return entry[0]
+
+    # 写入值与影子一致时跳过写入、读取的寄存器都在影子中时直接应答，返回构造的响应帧
+    def _shadow_lookup(self, function_code, register, value, values, read_length):
+        now = time.monotonic()
+        if function_code == 0x06:
+            if register != CONTROL_REGISTER or not value & CLEAR_PROTECTION_BIT:
+                if self._shadow_value(register, now) == value:
+                    self.shadow_stats['skipped_writes'] += 1
+                    return build_write_response(self.slave_id, 0x06, register, value)
+        elif function_code == 0x10:
+            if all(self._shadow_value(register + i, now) == v for i, v in enumerate(values)):
+                self.shadow_stats['skipped_writes'] += 1
+                return build_write_response(self.slave_id, 0x10, register, len(values))
+        elif function_code == 0x03:
+            addresses = range(register, register + read_length)
+            if VOLATILE_REGISTERS.isdisjoint(addresses):
+                cached = [self._shadow_value(a, now) for a in addresses]
+                if None not in cached:
+                    self.shadow_stats['cached_reads'] += 1
+                    return build_read_response(self.slave_id, cached)
+        return None
+
+    # 多寄存器写入时去掉首尾未变化的寄存器
+    def _shadow_trim(self, register, values):
+        now = time.monotonic()
+        changed = [i for i, v in enumerate(values) if self._shadow_value(register + i, now) != v]
+        first, last = changed[0], changed[-1]
+        return register + first, values[first:last + 1]
+
+    def _shadow_update(self, function_code, register, value, values, read_length, response):
+        now = time.monotonic()
+        if function_code == 0x03:
+            registers = decode_registers(response, read_length)
+            if registers is None:
+                return
+            for address, reg in zip(range(register, register + read_length), registers):
+                if address not in VOLATILE_REGISTERS:
+                    self.shadow[address] = (reg, now)
+            if register <= STATUS_REGISTER < register + read_length and not register <= CONTROL_REGISTER < register + read_length:
+                status = registers[STATUS_REGISTER - register]
+                control = self._shadow_value(CONTROL_REGISTER, now)
+                # 保护触发或输出状态与影子不符（设备自行关断），控制字不再可信
+                if status & TRIP_BITS or (control is not None and (control ^ status) & CONTROL_MASKS['output_on']):
+                    self.shadow.pop(CONTROL_REGISTER, None)
+            return
+        if function_code == 0x06:
+            written = {register: value}
+        else:
+            written = dict(zip(range(register, register + len(values)), values))
+        ok = len(response) == 8 and response[1] == function_code
+        for address, reg in written.items():
+            if not ok or (address == CONTROL_REGISTER and reg & CLEAR_PROTECTION_BIT):
+                # 写入失败或清除保护：设备状态未知，使对应影子失效
+                self.shadow.pop(address, None)
+            else:
+                self.shadow[address] = (reg, now)
+
+
+# 以下为各操作的生成器，HCP1020Controller等控制器的同名方法执行它们
+
+# 按规划读取多个寄存器区间，返回 {地址: 值}
+def read_register_blocks(ranges, max_read_registers, max_gap=0):
+    result = {}
+    for start, count in plan_register_reads(ranges, max_read_registers, max_gap):
+        result.update(zip(range(start, start + count), (yield Read(start, count))))
+    return result
+
+
+# 一次轮询读取全部遥测寄存器并解析为物理值
+def query_telemetry(max_read_registers):
+    return decode_telemetry((yield from read_register_blocks(TELEMETRY_BLOCKS, max_read_registers)))
+
+
+# 电压控制 (0x03寄存器，10mV单位)
+def set_voltage(volts):
+    return (yield Write(register_address('set_voltage'), to_raw('set_voltage', volts)))
+
+
+# 电流控制 (0x04寄存器，1mA单位)
+def set_current(amps):
+    return (yield Write(register_address('set_current'), to_raw('set_current', amps)))
+
+
+# 输出开关控制 (0x05寄存器位0)
+def set_output(state):
+    return (yield Write(CONTROL_REGISTER, encode_bits(CONTROL_BITS, output_on=state)))
+
+
+# 一次0x10写入设定电压、电流和输出开关（0x0003起3个寄存器）
+def set_voltage_current_output(volts, amps, output_state):
+    values = [to_raw('set_voltage', volts), to_raw('set_current', amps),
+              encode_bits(CONTROL_BITS, output_on=output_state)]
+    return (yield WriteMultiple(register_address('set_voltage'), values))
+
+
+# 一次0x10写入过压、过流保护值（0x0006起2个寄存器）
+def set_protection_values(ovp_volts, ocp_amps):
+    return (yield WriteMultiple(register_address('ovp'), [to_raw('ovp', ovp_volts), to_raw('ocp', ocp_amps)]))
+
+
+def set_ovp(volts):
+    return (yield Write(register_address('ovp'), to_raw('ovp', volts)))
+
+
+def set_ocp(amps):
+    return (yield Write(register_address('ocp'), to_raw('ocp', amps)))
+
+
+# 控制字位0：输出开关，位3：OVP功能，位4：OCP功能
+def set_output_protections(output_on=True, ovp_enable=True, ocp_enable=True):
+    return (yield Write(CONTROL_REGISTER, encode_bits(CONTROL_BITS, output_on=output_on, ovp_enable=ovp_enable,
+                                                      ocp_enable=ocp_enable)))
+
+
+# 一次读取0x0003起的3个寄存器（设定电压、电流、控制字）
+# 示例响应：11 03 06 01 F4 04 B0 00 01 9D A6
+def query_settings():
+    voltage_reg, current_reg, status_reg = yield Read(register_address('set_voltage'), 3)
+    result = {
+        'voltage': from_raw('set_voltage', voltage_reg),
+        'current': from_raw('set_current', current_reg)
+    }
+    result.update(decode_bits(status_reg, STATUS_BITS[:3]))  # 输出状态、恒压、恒流
+    return result
+
+
+def read_voltage():
+    return from_raw('voltage', (yield Read(register_address('voltage'), 1))[0])
+
+
+def read_current():
+    return from_raw('current', (yield Read(register_address('current'), 1))[0])
+
+
+def read_status():
+    return decode_status((yield Read(STATUS_REGISTER, 1))[0])
+
+
+# 一次读取0x0000起的3个寄存器（实际电压、电流、状态）
+# 示例响应：11 03 06 01 F3 00 00 03 XX XX
+def query_actual_values(deadline=None):
+    voltage_reg, current_reg, status_reg = yield Read(register_address('voltage'), 3, deadline)
+    return {
+        'voltage': from_raw('voltage', voltage_reg),
+        'current': from_raw('current', current_reg),
+        'output_status': decode_bits(status_reg, STATUS_BITS[:5])  # 位0-4：输出、CV、CC、OVP、OCP
+    }
+
+
+# 恒功率模式设置
+def set_constant_power(watts):
+    yield Write(register_address('line_compensation'), 100)  # 线阻补偿（示例值）
+    yield Write(register_address('load_resistance'), 500)  # 负载阻值（示例值）
+    yield Write(register_address('cp_mode'), 0x0001)  # 启用恒功率模式
+    return (yield Write(register_address('power'), to_raw('power', watts)))  # 10mW单位
+
+
+# 定时输出序列，见HCP1020Controller.execute_sequence；estimate()返回一次事务的预计耗时
+def execute_sequence(sequence, sample_interval, estimate):
+    report = []
+    start = time.monotonic()
+    deadline = start
+    for volt, curr, duration in sequence:
+        yield Sleep(deadline)
+        actual = time.monotonic()
+        yield from set_voltage_current_output(volt, curr, True)
+        step = {'planned': deadline - start, 'actual': actual - start,
+                'lateness': actual - deadline, 'samples': []}
+        deadline += duration
+        if sample_interval:
+            next_sample = actual + sample_interval
+            # 预计来得及完成时才采样；采样等待响应不超过下一步的开始时刻，来不及时不重试
+            while next_sample + estimate() < deadline:
+                yield Sleep(next_sample)
+                try:
+                    values = yield from query_actual_values(deadline)
+                except ModbusError:
+                    values = None  # 采样失败不影响序列执行
+                step['samples'].append((time.monotonic() - start, values))
+                next_sample += sample_interval
+        report.append(step)
+    yield Sleep(deadline)
+    yield from set_output(False)
+    return report
+
+
+def clear_protections():
+    return (yield Write(CONTROL_REGISTER, CLEAR_PROTECTION_BIT))
+
+
+def lock_keyboard(lock=True):
+    return (yield Write(CONTROL_REGISTER, encode_bits(CONTROL_BITS, keyboard_lock=lock)))
+
+
+# PowerSupplyController的查询：读取失败时收到None，返回None
+
+# 设定电压、电流和控制字的输出位
+def query_voltage_current_status():
+    registers = yield Read(register_address('set_voltage'), 3)
+    if registers:
+        return {"voltage": from_raw('set_voltage', registers[0]),
+                "current": from_raw('set_current', registers[1]),
+                "status": "ON" if registers[2] & CONTROL_MASKS['output_on'] else "OFF"}
+    return None
+
+
+def query_voltage_display():
+    registers = yield Read(register_address('voltage'), 1)
+    return from_raw('voltage', registers[0]) if registers else None
+
+
+def query_current_display():
+    registers = yield Read(register_address('current'), 1)
+    return from_raw('current', registers[0]) if registers else None
+
+
+# 只看位0，恒压/恒流等其他状态位置位时输出仍为开
+def query_output_status():
+    registers = yield Read(STATUS_REGISTER, 1)
+    if registers:
+        return "ON" if registers[0] & STATUS_MASKS['output_on'] else "OFF"
+    return None
+
+
+def query_voltage_current_status_display():
+    registers = yield Read(register_address('voltage'), 3)
+    if registers:
+        return {"voltage": from_raw('voltage', registers[0]),
+                "current": from_raw('current', registers[1]),
+                "status": "ON" if registers[2] & STATUS_MASKS['output_on'] else "OFF"}
+    return None
@@ -0,0 +1,265 @@
+import random
+import struct
+import time
+
+from crc16 import check_crc, crc16_bytes
+from modbus_rtu import build_request, build_read_response, build_write_response, decode_registers, read_frame
+
+# HCP1020本地模拟器：实现控制器使用的寄存器表，以及可替代串口的回环端口，
+# 无需硬件即可测量吞吐和延时
+
+# 寄存器表：0x0000-0x0002只读（实际电压/电流/状态），其余可读写
+READ_ONLY_REGISTERS = frozenset([0x0000, 0x0001, 0x0002])
+VALID_REGISTERS = frozenset(list(range(0x0000, 0x0008)) + list(range(0x0030, 0x0035)))
+
+
+class HCP1020Simulator:
+    """模拟一台HCP1020电源，负载为纯电阻load_ohms"""
+
+    def __init__(self, slave_id=1, load_ohms=10.0):
+        self.slave_id = slave_id
+        self.load_ohms = load_ohms
+        self.registers = dict.fromkeys(VALID_REGISTERS, 0)
+        self.registers[0x0006] = 0x07D0  # OVP 20.00V
+        self.registers[0x0007] = 0x0C80  # OCP 3.200A
+        self.trips = 0  # 保护触发位（状态寄存器位3-5）
+        self.requests = 0
+        self._update()
+
+    # 注入保护触发（测试用）
+    def trip(self, ovp=False, ocp=False, otp=False):
+        self.trips |= (0x08 if ovp else 0) | (0x10 if ocp else 0) | (0x20 if otp else 0)
+        self._update()
+
+    def _update(self):
+        regs = self.registers
+        control = regs[0x0005]
+        voltage = current = 0.0
+        status = self.trips
+        if control & 0x0001 and not self.trips:
+            set_voltage = regs[0x0003] / 100.0
+            set_current = regs[0x0004] / 1000.0
+            if regs[0x0032] & 0x0001:  # 恒功率模式
+                set_voltage = min(set_voltage, (regs[0x0034] / 100.0 * self.load_ohms) ** 0.5)
+            if set_voltage / self.load_ohms <= set_current:
+                voltage, current, mode = set_voltage, set_voltage / self.load_ohms, 0x02  # CV
+            else:
+                voltage, current, mode = set_current * self.load_ohms, set_current, 0x04  # CC
+            if control & 0x0008 and voltage > regs[0x0006] / 100.0:
+                self.trips |= 0x08
+            if control & 0x0010 and current > regs[0x0007] / 1000.0:
+                self.trips |= 0x10
+            if self.trips:
+                voltage = current = 0.0
+                status = self.trips
+            else:
+                status = 0x01 | mode
+        regs[0x0000] = min(int(round(voltage * 100)), 0xFFFF)
+        regs[0x0001] = min(int(round(current * 1000)), 0xFFFF)
+        regs[0x0002] = status
+
+    def _exception(self, function_code, code):
+        frame = struct.pack('>BBB', self.slave_id, function_code | 0x80, code)
+        return frame + crc16_bytes(frame)
+
+    def _write(self, register, value):
+        if register == 0x0005 and value & 0x0040:  # 清除保护
+            self.trips = 0
+            value &= ~0x0040
+        self.registers[register] = value
+
+    # 处理一帧请求，返回响应帧；CRC错误或地址不符时不响应，返回None
+    def handle_request(self, frame):
+        if not check_crc(frame) or frame[0] != self.slave_id:
+            return None
+        self.requests += 1
+        function_code = frame[1]
+        if function_code == 0x03:
+            register, count = struct.unpack('>HH', frame[2:6])
+            addresses = range(register, register + count)
+            if not 1 <= count <= 125 or not VALID_REGISTERS.issuperset(addresses):
+                return self._exception(function_code, 0x02)
+            return build_read_response(self.slave_id, [self.registers[a] for a in addresses])
+        if function_code == 0x06:
+            register, value = struct.unpack('>HH', frame[2:6])
+            if register not in VALID_REGISTERS or register in READ_ONLY_REGISTERS:
+                return self._exception(function_code, 0x02)
+            self._write(register, value)
+            self._update()
+            return build_write_response(self.slave_id, 0x06, register, value)
+        if function_code == 0x10:
+            register, count, byte_count = struct.unpack('>HHB', frame[2:7])
+            addresses = range(register, register + count)
+            if byte_count != count * 2 or len(frame) != 9 + byte_count:
+                return self._exception(function_code, 0x03)
+            if not VALID_REGISTERS.issuperset(addresses) or not READ_ONLY_REGISTERS.isdisjoint(addresses):
+                return self._exception(function_code, 0x02)
+            for address, value in zip(addresses, struct.unpack('>%dH' % count, frame[7:7 + byte_count])):
+                self._write(address, value)
+            self._update()
+            return build_write_response(self.slave_id, 0x10, register, count)
+        return self._exception(function_code, 0x01)
+
+
+class SimulatedSerial:
+    """可替代serial.Serial的回环端口：写入的请求交给模拟器处理，响应按波特率逐字节到达
+
+    response_delay: 设备处理时间（秒）；noise: 响应中翻转一位的概率；drop_rate: 不响应的概率；
+    realtime=False时不模拟传输时间，用于只测量主机侧开销
+    """
+
+    def __init__(self, simulators, baudrate=9600, timeout=1, response_delay=0.0,
+                 noise=0.0, drop_rate=0.0, realtime=True, seed=None):
+        if isinstance(simulators, HCP1020Simulator):
+            simulators = [simulators]
+        self.simulators = {sim.slave_id: sim for sim in simulators}  # 同一总线上可挂多台
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.inter_byte_timeout = None
+        self.response_delay = response_delay
+        self.noise = noise
+        self.drop_rate = drop_rate
+        self.char_time = 10 / baudrate if realtime else 0.0  # 8N1每字符10位
+        self.is_open = True
+        self.port = 'sim'
+        self._random = random.Random(seed)
+        self._rx = bytearray()
+        self._rx_times = []  # 每个待读字节的到达时间
+        self._line_free = 0.0
+        self.stats = {'requests': 0, 'dropped': 0, 'corrupted': 0, 'bytes_written': 0, 'bytes_read': 0}
+
+    def write(self, data):
+        data = bytes(data)
+        now = time.perf_counter()
+        self.stats['requests'] += 1
+        self.stats['bytes_written'] += len(data)
+        sent = max(now, self._line_free) + len(data) * self.char_time
+        self._line_free = sent
+        sim = self.simulators.get(data[0]) if data else None
+        response = sim.handle_request(data) if sim else None
+        if response is None or self._random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            return len(data)
+        if self.noise and self._random.random() < self.noise:
+            response = bytearray(response)
+            response[self._random.randrange(len(response))] ^= 1 << self._random.randrange(8)
+            self.stats['corrupted'] += 1
+        start = max(sent + self.response_delay, self._rx_times[-1] if self._rx_times else 0.0)
+        self._rx += response
+        self._rx_times.extend(start + (i + 1) * self.char_time for i in range(len(response)))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        now = time.perf_counter()
+        count = 0
+        for t in self._rx_times:
+            if t > now:
+                break
+            count += 1
+        return count
+
+    def _take(self, count):
+        data = bytes(self._rx[:count])
+        last = self._rx_times[count - 1]
+        del self._rx[:count]
+        del self._rx_times[:count]
+        self.stats['bytes_read'] += count
+        return data, last
+
+    # 与pyserial一致：timeout为整次读取的超时，inter_byte_timeout为字节间超时
+    def read(self, size=1):
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else float('inf')
+        out = bytearray()
+        last = None
+        while len(out) < size:
+            now = time.perf_counter()
+            available = min(self.in_waiting, size - len(out))
+            if available:
+                data, last = self._take(available)
+                out += data
+                continue
+            if self.timeout == 0:
+                break
+            limit = deadline
+            if last is not None and self.inter_byte_timeout is not None:
+                limit = min(limit, last + self.inter_byte_timeout)
+            next_byte = self._rx_times[0] if self._rx_times else float('inf')
+            if next_byte > limit:
+                if limit > now:
+                    time.sleep(limit - now)
+                break
+            time.sleep(max(0.0, next_byte - now))
+        return bytes(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read_all(self):
+        return self.read(self.in_waiting)
+
+    def reset_input_buffer(self):
+        available = self.in_waiting
+        if available:
+            self._take(available)
+
+    def close(self):
+        self.is_open = False
+
+
+class _Result:
+    """与pymodbus响应对象接口一致的结果"""
+
+    def __init__(self, registers=None, error=None):
+        self.registers = registers
+        self.error = error
+
+    def isError(self):
+        return self.error is not None
+
+    def __str__(self):
+        return f"Modbus错误: {self.error}"
+
+
+class SimulatorModbusClient:
+    """可替代pymodbus ModbusSerialClient的客户端，经SimulatedSerial访问模拟器"""
+
+    def __init__(self, port):
+        self.port = port
+        self.port.inter_byte_timeout = max(self.port.char_time * 3.5, 0.00175)
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def _transact(self, frame):
+        self.port.reset_input_buffer()
+        self.port.write(frame)
+        return read_frame(self.port)
+
+    def read_holding_registers(self, address, count=1, unit=1):
+        response = self._transact(build_request(unit, 0x03, address, read_length=count))
+        registers = decode_registers(response, count) if check_crc(response) else None
+        if registers is None:
+            return _Result(error=response.hex())
+        return _Result(list(registers))
+
+    def _write(self, frame, function_code):
+        response = self._transact(frame)
+        if len(response) == 8 and response[1] == function_code and check_crc(response):
+            return _Result()
+        return _Result(error=response.hex())
+
+    def write_register(self, address, value, unit=1):
+        return self._write(build_request(unit, 0x06, address, value), 0x06)
+
+    def write_registers(self, address, values, unit=1):
+        return self._write(build_request(unit, 0x10, address, values=values), 0x10)
@@ -1,14 +1,17 @@
 import serial
-import time
+from crc16 import append_crc
+from rtu_sniffer import BusSniffer, CaptureWriter, format_transaction
 
 # 配置参数
 PORT_A = 'COM3'   # PortA的串口号 (发送端)
 PORT_B = 'COM6'   # PortB的串口号 (接收端)
 BAUD_RATE = 115200  # 保持与设备匹配的波特率
+SNIFF_SECONDS = 5  # PortB持续监听时长（秒），None表示直到Ctrl+C
+CAPTURE_FILE = 'portb_capture.bin'  # 抓包文件，可用 python rtu_sniffer.py --replay 回放；None表示不保存
 
 # 图片中指令对应的Modbus RTU帧（十六进制）
-# 地址11(0x11)、命令03(0x03)、参数地址00 00(0x0000)、读取长度00 01(0x0001)、CRC校验86 9A(0x86 0x9A)
-TEST_MESSAGE = bytes.fromhex('11 03 00 00 00 01 86 9A')
+# 地址11(0x11)、命令03(0x03)、参数地址00 00(0x0000)、读取长度00 01(0x0001)、CRC校验由crc16计算(86 9A)
+TEST_MESSAGE = append_crc(bytes.fromhex('11 03 00 00 00 01'))
 
 # 初始化两个串口
 try:
@@ -38,19 +41,24 @@ try:
     print(f"从PortA发送指令 (十六进制): {TEST_MESSAGE.hex().upper()}")
     ser_a.write(TEST_MESSAGE)
     
-    # 在PortB接收数据（打印原始十六进制，便于验证）
-    print("在PortB等待接收数据...")
-    start_time = time.time()
-    timeout = 5  # 5秒超时
-    
-    while time.time() - start_time < timeout:
-        data = ser_b.read(1024)  # 读取最多1024字节
-        if data:
-            print(f"PortB收到 (十六进制): {data.hex().upper()}")
-            break
-        time.sleep(0.1)  # 短暂等待
-    else:
+    # 在PortB持续监听：按帧切分并配对请求/响应，打印时间戳和往返时间
+    print("在PortB监听总线...")
+    capture = CaptureWriter(CAPTURE_FILE, BAUD_RATE) if CAPTURE_FILE else None
+    sniffer = BusSniffer(ser_b, BAUD_RATE, capture=capture)
+    try:
+        for transaction in sniffer.transactions(SNIFF_SECONDS):
+            print(format_transaction(transaction))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sniffer.stop()
+        if capture is not None:
+            capture.close()
+    stats = sniffer.splitter.stats
+    if not stats['bytes']:
         print("错误: 未在PortB收到数据!")
+    else:
+        print(f"PortB共收到 {stats['bytes']} 字节，{stats['frames']} 帧，垃圾字节 {stats['garbage_bytes']}")
     
 except serial.SerialException as e:
     print(f"串口错误: {e}")
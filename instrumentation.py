@@ -0,0 +1,116 @@
+import bisect
+import json
+import threading
+
+# 事务层性能埋点：分阶段计时直方图和事件计数，可导出JSON或Prometheus文本格式
+# 控制器的instrumentation属性为None时不做任何计时，开销只有一次属性判断
+
+# 事务阶段
+PHASES = ('encode', 'write', 'first_byte', 'full_frame', 'decode')
+# 直方图桶上界（秒）
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# 最近秩法计算已排序样本的分位数（p为0-100），基准和定时报告共用
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Histogram:
+    """固定桶直方图"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    # 由桶计数估算分位数（取所在桶的上界）
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            total += count
+            if total >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))
+        }
+
+
+class Instrumentation:
+    """分阶段计时与计数（retries/timeouts/crc_failures/errors等）"""
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    def count(self, event, n=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.phases.clear()
+            self.counters.clear()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'phases': {name: h.to_dict() for name, h in self.phases.items()},
+                'counters': dict(self.counters)
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    # Prometheus文本格式
+    def to_prometheus(self, prefix='modbus'):
+        lines = [f"# TYPE {prefix}_phase_seconds histogram"]
+        with self._lock:
+            for name, h in self.phases.items():
+                cumulative = 0
+                for bound, count in zip([str(b) for b in h.buckets] + ['+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_phase_seconds_bucket{{phase="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_phase_seconds_sum{{phase="{name}"}} {h.sum}')
+                lines.append(f'{prefix}_phase_seconds_count{{phase="{name}"}} {h.count}')
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for event, value in self.counters.items():
+                lines.append(f'{prefix}_events_total{{event="{event}"}} {value}')
+        return '\n'.join(lines) + '\n'
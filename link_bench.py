@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import random
+import select
+import struct
+import threading
+import time
+
+from crc16 import crc16
+from instrumentation import percentile
+
+# 串口链路基准：PortA持续发送带序号、发送时间和CRC的数据包，PortB同时接收校验，
+# 测量持续吞吐、单向延时分布、丢失和损坏；可自动扫描波特率和缓冲区大小。
+# 两端在同一进程中，发送时间和接收时间使用同一个单调时钟，单向延时可直接相减。
+
+# 数据包: 同步字A5 5A | 序号(I) | 发送时间(d) | 包长(H) | 填充 | CRC16（小端）
+_PACKET_HEADER = struct.Struct('<2sIdH')
+_SYNC = b'\xa5\x5a'
+MIN_PACKET = _PACKET_HEADER.size + 2
+
+PATTERNS = ('zeros', 'ones', 'alternating', 'counter', 'random')
+
+
+def make_filler(pattern, size, seed=0):
+    if pattern == 'zeros':
+        return bytes(size)
+    if pattern == 'ones':
+        return b'\xff' * size
+    if pattern == 'alternating':
+        return (b'\x55\xaa' * (size // 2 + 1))[:size]
+    if pattern == 'counter':
+        return bytes(i & 0xFF for i in range(size))
+    if pattern == 'random':
+        return bytes(random.Random(seed).getrandbits(8) for _ in range(size))
+    raise ValueError(f"未知的数据模式: {pattern}")
+
+
+class PtyPort:
+    """伪终端一端，接口与serial.Serial的读写部分一致；无需硬件即可运行链路基准（不模拟波特率）"""
+
+    def __init__(self, fd, name):
+        self.fd = fd
+        self.port = name
+        self.baudrate = 0
+        self.timeout = 1
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        import fcntl, termios  # 仅类Unix系统可用
+        return struct.unpack('i', fcntl.ioctl(self.fd, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+    def read(self, size=1):
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        out = bytearray()
+        while len(out) < size:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            if not select.select([self.fd], [], [], remaining)[0]:
+                break
+            out += os.read(self.fd, size - len(out))
+        return bytes(out)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            os.close(self.fd)
+            self.is_open = False
+
+
+# 创建一对相连的伪终端，返回 (PortA, PortB)
+def open_pty_pair():
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return PtyPort(master, 'pty-master'), PtyPort(slave, os.ttyname(slave))
+
+
+def open_serial(port, baudrate, timeout=0.1):
+    import serial  # 只有使用真实串口时才需要pyserial
+    return serial.Serial(port=port, baudrate=baudrate, bytesize=8, parity='N', stopbits=1, timeout=timeout)
+
+
+def _set_buffer_size(ser, size):
+    set_buffer_size = getattr(ser, 'set_buffer_size', None)  # 只有Windows驱动支持
+    if set_buffer_size is not None:
+        set_buffer_size(rx_size=max(size, 4096), tx_size=max(size, 4096))
+
+
+class LinkTest:
+    """一次链路测试：writer/reader两个线程同时运行
+
+    window: 已发送未收到的最大字节数，写端超前太多时等待，避免延时被发送队列拉长；
+    在途量取按字节和按包序号计算的较小值：损坏的包字节已到达，按字节释放；丢失的字节按字节计算永远不会到达，
+    收到序号为s的包后s之前的包不再占用窗口；最后发出的包丢失时最多等待100ms，之后发出的包到达即释放
+    """
+
+    def __init__(self, port_a, port_b, packet_size=256, pattern='random', read_size=4096,
+                 window=None, seed=0):
+        if packet_size < MIN_PACKET:
+            raise ValueError(f"包长至少{MIN_PACKET}字节")
+        self.port_a = port_a
+        self.port_b = port_b
+        self.packet_size = packet_size
+        self.pattern = pattern
+        self.read_size = read_size
+        self.window = window if window is not None else 2 * packet_size
+        self.filler = make_filler(pattern, packet_size - MIN_PACKET, seed)
+        self._lock = threading.Condition()
+        self._running = False
+
+    def _packet(self, seq):
+        body = _PACKET_HEADER.pack(_SYNC, seq, time.perf_counter(), self.packet_size) + self.filler
+        return body + struct.pack('<H', crc16(body))
+
+    def _write_loop(self, duration):
+        deadline = time.perf_counter() + duration
+        seq = 0
+        while time.perf_counter() < deadline:
+            with self._lock:
+                # 等待接收端追上；最后发出的包丢失时不会追上，最多等100ms后继续发送
+                if self._in_flight() >= self.window:
+                    if not self._lock.wait_for(lambda: self._in_flight() < self.window, 0.1):
+                        self.stalls += 1
+            packet = self._packet(seq)
+            self.port_a.write(packet)
+            seq += 1
+            with self._lock:
+                self.bytes_sent += len(packet)
+                self._sent_seq = seq
+        self.packets_sent = seq
+
+    # 在途字节数
+    def _in_flight(self):
+        return min(self.bytes_sent - self.bytes_received, (self._sent_seq - self._next_seq) * self.packet_size)
+
+    def _read_loop(self):
+        port = self.port_b
+        buf = bytearray()
+        while self._running or port.in_waiting:
+            data = port.read(1)
+            if not data:
+                continue
+            waiting = port.in_waiting
+            if waiting:
+                data += port.read(min(waiting, self.read_size))
+            now = time.perf_counter()
+            buf += data
+            with self._lock:
+                self.bytes_received += len(data)
+                self._lock.notify()
+            while True:
+                start = buf.find(_SYNC)
+                if start < 0:
+                    self.garbage_bytes += max(len(buf) - 1, 0)
+                    del buf[:max(len(buf) - 1, 0)]  # 保留最后一个字节，可能是同步字的前半
+                    break
+                if start:
+                    self.garbage_bytes += start
+                    del buf[:start]
+                if len(buf) < _PACKET_HEADER.size:
+                    break
+                _, seq, sent, length = _PACKET_HEADER.unpack_from(buf)
+                if length != self.packet_size:  # 包头损坏，跳过同步字重新同步
+                    self.corrupted += 1
+                    del buf[:2]
+                    continue
+                if len(buf) < length:
+                    break
+                if crc16(memoryview(buf)[:length]) != 0:
+                    self.corrupted += 1
+                    del buf[:2]
+                    continue
+                self.latencies.append(now - sent)
+                self.packets_received += 1
+                if seq >= self._next_seq:
+                    with self._lock:
+                        self._next_seq = seq + 1  # 跳过的序号已丢失
+                        self._lock.notify()
+                del buf[:length]
+
+    def run(self, duration=2.0, drain_timeout=1.0):
+        self.bytes_sent = self.bytes_received = 0
+        self._sent_seq = self._next_seq = 0
+        self.packets_sent = self.packets_received = 0
+        self.corrupted = self.garbage_bytes = self.stalls = 0
+        self.latencies = []
+        self.port_b.timeout = 0.05
+        self._running = True
+        reader = threading.Thread(target=self._read_loop, name='link-reader', daemon=True)
+        reader.start()
+        start = time.perf_counter()
+        self._write_loop(duration)
+        # 等待在途字节到达，超过drain_timeout仍未到达的计为丢失
+        with self._lock:
+            self._lock.wait_for(lambda: self.bytes_received >= self.bytes_sent, drain_timeout)
+        elapsed = time.perf_counter() - start
+        self._running = False
+        reader.join()
+        return self._report(elapsed)
+
+    def _report(self, elapsed):
+        latencies = sorted(self.latencies)
+        baudrate = getattr(self.port_a, 'baudrate', 0)
+        throughput = self.bytes_received / elapsed if elapsed else 0.0
+        # 8N1每字节10位；伪终端不限速，效率没有意义
+        line_rate = baudrate / 10 if baudrate and not isinstance(self.port_a, PtyPort) else 0
+        return {
+            'baudrate': baudrate,
+            'packet_size': self.packet_size,
+            'pattern': self.pattern,
+            'read_size': self.read_size,
+            'elapsed': elapsed,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'bytes_lost': max(self.bytes_sent - self.bytes_received, 0),
+            'throughput': throughput,  # 字节/秒
+            'efficiency': throughput / line_rate if line_rate else None,
+            'packets_sent': self.packets_sent,
+            'packets_received': self.packets_received,
+            'packets_lost': max(self.packets_sent - self.packets_received, 0),  # 含损坏的包
+            'packets_corrupted': self.corrupted,
+            'garbage_bytes': self.garbage_bytes,
+            'writer_stalls': self.stalls,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+            'latency_max': latencies[-1] if latencies else 0.0
+        }
+
+
+# 扫描波特率 x 缓冲区大小，每个组合运行一次LinkTest
+def sweep(port_a, port_b, baudrates, buffer_sizes, packet_size=256, pattern='random', duration=2.0):
+    results = []
+    for baudrate in baudrates:
+        for port in (port_a, port_b):
+            port.baudrate = baudrate
+        for size in buffer_sizes:
+            _set_buffer_size(port_a, size)
+            _set_buffer_size(port_b, size)
+            results.append(LinkTest(port_a, port_b, packet_size, pattern, read_size=size).run(duration))
+    return results
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="串口链路吞吐与延时基准（PortA发送，PortB接收）")
+    parser.add_argument('--port-a', default='COM3', help="发送端串口")
+    parser.add_argument('--port-b', default='COM6', help="接收端串口")
+    parser.add_argument('--pty', action='store_true', help="使用本机伪终端对代替串口，无需硬件")
+    parser.add_argument('--baudrates', type=_int_list, default=[9600, 115200], help="逗号分隔")
+    parser.add_argument('--buffer-sizes', type=_int_list, default=[64, 4096],
+                        help="接收端单次读取/驱动缓冲区大小，逗号分隔")
+    parser.add_argument('--packet-size', type=int, default=256)
+    parser.add_argument('--pattern', choices=PATTERNS, default='random')
+    parser.add_argument('--duration', type=float, default=2.0, help="每个组合的发送时长（秒）")
+    parser.add_argument('--output', help="JSON结果文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    if args.pty:
+        port_a, port_b = open_pty_pair()
+    else:
+        port_a = open_serial(args.port_a, args.baudrates[0])
+        port_b = open_serial(args.port_b, args.baudrates[0])
+    try:
+        results = sweep(port_a, port_b, args.baudrates, args.buffer_sizes, args.packet_size,
+                        args.pattern, args.duration)
+    finally:
+        port_a.close()
+        port_b.close()
+    report = {
+        'python': platform.python_version(),
+        'port_a': port_a.port,
+        'port_b': port_b.port,
+        'emulated': args.pty,  # 伪终端不限速，吞吐只反映主机侧开销
+        'results': results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import asyncio
+import logging
+import time
+import hcp1020_protocol
+from hcp1020_protocol import HCP1020Protocol, Read, Write, WriteMultiple
+from modbus_rtu import (frame_silence, expected_response_length, build_request, decode_registers,
+                        validate_response, late_response_wait, MAX_FRAME,
+                        ModbusError, ModbusTimeoutError, ModbusExceptionResponse)
+
+log = logging.getLogger(__name__)
+
+# 基于asyncio的MODBUS RTU传输：一个事件循环同时服务多个串口，无需每个串口一个线程
+# 控制器的请求构造、校验、重试和响应解析与同步版共用hcp1020_protocol，这里只实现异步IO
+
+
+class AsyncSerialTransport:
+    """异步串口传输，按帧长/帧间静默读取响应"""
+
+    # ser可传入已打开的串口对象（如hcp1020_sim.SimulatedSerial），此时不再打开port
+    def __init__(self, port, baudrate=9600, timeout=1, ser=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout  # 等待响应首字节的超时时间
+        self.silence = frame_silence(baudrate)
+        self.ser = ser
+        self._buffer = bytearray()
+        self._late_until = None  # 上次事务超时后，迟到的响应可能到达的最晚时刻（事件循环时间）
+        self._data_ready = None
+        self._lock = None
+        self._use_reader = False
+
+    async def open(self):
+        if self.ser is None:
+            import serial  # 只有按串口名打开时才需要pyserial
+            self.ser = serial.Serial(
+                port=self.port,
+                baudrate=self.baudrate,
+                bytesize=8,
+                parity='N',
+                stopbits=1,
+                timeout=0
+            )
+        self.ser.timeout = 0  # 非阻塞读，只取已到达的字节
+        self._data_ready = asyncio.Event()
+        self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        try:
+            # POSIX下直接监听串口文件描述符
+            loop.add_reader(self.ser.fileno(), self._on_readable)
+            self._use_reader = True
+        except (NotImplementedError, AttributeError):
+            # Windows的Proactor循环不支持add_reader，退化为按帧间静默时间轮询
+            self._use_reader = False
+        return self
+
+    async def close(self):
+        if self.ser and self.ser.is_open:
+            if self._use_reader:
+                asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            self.ser.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _on_readable(self):
+        self._buffer += self.ser.read(self.ser.in_waiting or 1)
+        self._data_ready.set()
+
+    async def _wait_data(self):
+        if self._use_reader:
+            self._data_ready.clear()
+            await self._data_ready.wait()
+        else:
+            while not self.ser.in_waiting:
+                await asyncio.sleep(max(self.silence / 2, 0.001))
+            self._buffer += self.ser.read(self.ser.in_waiting)
+
+    # 发送请求帧并读取一帧响应；同一串口上的事务串行执行
+    # timeout不为None时代替self.timeout作为本次等待首字节的超时时间
+    async def transact(self, frame, timeout=None):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            if self._late_until is not None:
+                # 丢弃上一个超时请求迟到的响应，直到线路静默，等待时间见late_response_wait；
+                # 读请求在本次超时时间内等不到时按超时处理
+                now = loop.time()
+                wait = late_response_wait(frame[1], self._late_until, now)
+                blocked = timeout is not None and wait > timeout
+                if await self._read_until_quiet(timeout if blocked else wait) \
+                        or (not blocked and now + wait >= self._late_until):
+                    self._late_until = None
+                elif blocked:
+                    return b''
+                if timeout is not None:
+                    timeout = max(timeout - (loop.time() - now), 0.0)
+            self._buffer.clear()
+            self.ser.reset_input_buffer()  # 丢弃上一次事务残留的字节
+            self.ser.write(frame)
+            response = await self._read_frame(self.timeout if timeout is None else timeout)
+            if not response:
+                self._late_until = loop.time() + self.timeout
+            return response
+
+    async def _read_frame(self, timeout):
+        buf = self._buffer
+        expected = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if expected is None and len(buf) >= 3:
+                expected = expected_response_length(buf)
+            if expected is not None and len(buf) >= expected:
+                frame = bytes(buf[:expected])
+                del buf[:expected]  # 多余的字节留给drain()
+                return frame
+            # 首字节前等待超时时间，之后只等待帧间静默
+            wait = self.silence if buf else deadline - loop.time()
+            if wait <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._wait_data(), wait)
+            except asyncio.TimeoutError:
+                break
+        frame = bytes(buf)
+        buf.clear()
+        return frame
+
+    # 读取线路上剩余的字节直到帧间静默，用于重新同步
+    async def drain(self):
+        async with self._lock:
+            return await self._read_until_quiet(self.silence * 10)  # 只等待很短时间
+
+    # 读取并取出缓冲区中的字节，直到帧间静默；wait为等待第一个字节的最长时间
+    async def _read_until_quiet(self, wait):
+        wait = max(wait, self.silence)
+        try:
+            while len(self._buffer) < MAX_FRAME:
+                await asyncio.wait_for(self._wait_data(), wait)
+                wait = self.silence
+        except asyncio.TimeoutError:
+            pass
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class AsyncHCP1020Controller(HCP1020Protocol):
+    """HCP1020Controller的异步版本，方法与同步版一一对应，通信失败时抛出ModbusError
+
+    请求构造、响应校验、重试、影子缓存和解析与同步版共用hcp1020_protocol
+    """
+
+    def __init__(self, transport, slave_id=1, max_read_registers=125,
+                 retries=2, retry_backoff=0.01, retry_backoff_max=0.2, shadow=False, shadow_ttl=5.0):
+        self.transport = transport
+        self._init_state(slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                         retry_backoff_max)
+
+    # 执行hcp1020_protocol中的操作生成器，通信失败时把ModbusError抛回生成器
+    async def _run(self, operation):
+        send = operation.send
+        result = None
+        while True:
+            try:
+                step = send(result)
+            except StopIteration as stop:
+                return stop.value
+            send = operation.send
+            try:
+                if type(step) is Read:
+                    result = await self.read_registers(step.register, step.count, step.deadline)
+                elif type(step) is Write:
+                    result = await self._send_modbus_command(0x06, step.register, step.value)
+                elif type(step) is WriteMultiple:
+                    result = await self._send_modbus_command(0x10, step.register, values=step.values)
+                else:
+                    await asyncio.sleep(max(0.0, step.deadline - time.monotonic()))
+                    result = None
+            except ModbusError as e:
+                send, result = operation.throw, e
+
+    # 执行一次命令，返回校验通过的响应，见HCP1020Controller._command
+    async def _send_modbus_command(self, function_code, register, value=None, values=None, read_length=1,
+                                   deadline=None):
+        if self.shadow is not None:
+            cached = self._shadow_lookup(function_code, register, value, values, read_length)
+            if cached is not None:
+                return cached
+            if function_code == 0x10:
+                register, values = self._shadow_trim(register, values)
+        # 每次构造新的请求帧：同一控制器上可能有多个协程同时等待响应
+        frame = build_request(self.slave_id, function_code, register, value, values, read_length)
+        count = len(values) if function_code == 0x10 else read_length
+        try:
+            response = await self._exchange(frame, function_code, register, value, count, deadline)
+        except ModbusError:
+            if self.shadow is not None and function_code != 0x03:
+                self._shadow_update(function_code, register, value, values, read_length, b'')
+            raise
+        if self.shadow is not None:
+            self._shadow_update(function_code, register, value, values, read_length, response)
+        return response
+
+    # 校验响应，失败时先尝试重新同步，仍失败则按退避时间重发（重试策略见HCP1020Protocol._retry_delay）
+    async def _exchange(self, frame, function_code, register, value, count, deadline=None):
+        attempt = 0
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            response = await self._transact(frame, timeout)
+            try:
+                return await self._validate(response, function_code, register, value, count)
+            except ModbusError as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, deadline))
+            attempt += 1
+
+    async def _validate(self, response, function_code, register, value, count):
+        try:
+            validate_response(response, self.slave_id, function_code, register, value, count)
+            return response
+        except (ModbusTimeoutError, ModbusExceptionResponse):
+            raise
+        except ModbusError:
+            data = response + await self.transport.drain()
+            frame = self._resync(data, function_code, register, value, count)
+            if frame is None:
+                raise
+            return frame
+
+    # 耗时包含等待同一串口上其他事务的时间
+    async def _transact(self, frame, timeout=None):
+        start = time.perf_counter()
+        response = await self.transport.transact(frame, timeout)
+        elapsed = time.perf_counter() - start
+        if self.instrumentation is not None:
+            self.instrumentation.observe('full_frame', elapsed)
+            self._count_response(response)
+        self._record_latency(elapsed, response)
+        return response
+
+    async def read_registers(self, register, count, deadline=None):
+        response = await self._send_modbus_command(0x03, register, read_length=count, deadline=deadline)
+        return decode_registers(response, count)
+
+    async def read_register_blocks(self, ranges, max_gap=0):
+        return await self._run(hcp1020_protocol.read_register_blocks(ranges, self.max_read_registers, max_gap))
+
+    async def query_telemetry(self):
+        return await self._run(hcp1020_protocol.query_telemetry(self.max_read_registers))
+
+    async def set_voltage(self, volts):
+        return await self._run(hcp1020_protocol.set_voltage(volts))
+
+    async def set_current(self, amps):
+        return await self._run(hcp1020_protocol.set_current(amps))
+
+    async def set_output(self, state):
+        return await self._run(hcp1020_protocol.set_output(state))
+
+    async def set_voltage_current_output(self, volts, amps, output_state):
+        return await self._run(hcp1020_protocol.set_voltage_current_output(volts, amps, output_state))
+
+    async def set_protection_values(self, ovp_volts, ocp_amps):
+        return await self._run(hcp1020_protocol.set_protection_values(ovp_volts, ocp_amps))
+
+    async def set_ovp(self, volts):
+        return await self._run(hcp1020_protocol.set_ovp(volts))
+
+    async def set_ocp(self, amps):
+        return await self._run(hcp1020_protocol.set_ocp(amps))
+
+    async def set_output_protections(self, output_on=True, ovp_enable=True, ocp_enable=True):
+        return await self._run(hcp1020_protocol.set_output_protections(output_on, ovp_enable, ocp_enable))
+
+    async def query_settings(self):
+        return await self._run(hcp1020_protocol.query_settings())
+
+    async def read_voltage(self):
+        return await self._run(hcp1020_protocol.read_voltage())
+
+    async def read_current(self):
+        return await self._run(hcp1020_protocol.read_current())
+
+    async def read_status(self):
+        return await self._run(hcp1020_protocol.read_status())
+
+    async def query_actual_values(self):
+        return await self._run(hcp1020_protocol.query_actual_values())
+
+    async def set_constant_power(self, watts):
+        return await self._run(hcp1020_protocol.set_constant_power(watts))
+
+    # 按绝对截止时间执行序列，可在步内采样，见HCP1020Controller.execute_sequence
+    async def execute_sequence(self, sequence, sample_interval=None):
+        return await self._run(hcp1020_protocol.execute_sequence(sequence, sample_interval, self._transaction_time))
+
+    async def clear_protections(self):
+        return await self._run(hcp1020_protocol.clear_protections())
+
+    async def lock_keyboard(self, lock=True):
+        return await self._run(hcp1020_protocol.lock_keyboard(lock))
+
+
+class AsyncPowerSupplyController:
+    """PowerSupplyController的异步版本，直接使用AsyncSerialTransport，返回值与同步版一致"""
+
+    def __init__(self, port, baudrate=9600, timeout=1):
+        self.transport = AsyncSerialTransport(port, baudrate, timeout)
+        self.connected = False
+
+    async def connect(self):
+        try:
+            await self.transport.open()
+            self.connected = True
+        except OSError:  # serial.SerialException是OSError的子类
+            self.connected = False
+        return self.connected
+
+    async def disconnect(self):
+        if self.connected:
+            await self.transport.close()
+            self.connected = False
+
+    # 执行一次请求：读命令返回寄存器列表，写命令返回True；与PowerSupplyController._execute一样，
+    # 通信异常、响应无效或异常响应时记录错误并返回None
+    async def _request(self, unit, function_code, register, value=None, values=None, read_length=1):
+        if not self.connected:
+            log.error("未连接到电源，无法发送命令")
+            return None
+        frame = build_request(unit, function_code, register, value, values, read_length)
+        count = len(values) if function_code == 0x10 else read_length
+        try:
+            response = await self.transport.transact(frame)
+            validate_response(response, unit, function_code, register, value, count)
+        except (OSError, ModbusError) as e:
+            log.error("命令执行错误: %s，功能码 0x%02X 地址: 0x%04X", e, function_code, register)
+            return None
+        if function_code == 0x03:
+            return list(decode_registers(response, read_length))
+        return True
+
+    # 执行hcp1020_protocol中的操作生成器，失败的请求把None送回生成器
+    async def _run(self, operation, unit):
+        result = None
+        while True:
+            try:
+                step = operation.send(result)
+            except StopIteration as stop:
+                return stop.value
+            if type(step) is Read:
+                result = await self._request(unit, 0x03, step.register, read_length=step.count)
+            elif type(step) is Write:
+                result = await self._request(unit, 0x06, step.register, step.value)
+            else:
+                result = await self._request(unit, 0x10, step.register, values=step.values)
+
+    async def set_voltage(self, voltage, unit=1):
+        return await self._run(hcp1020_protocol.set_voltage(voltage), unit)
+
+    async def set_current(self, current, unit=1):
+        return await self._run(hcp1020_protocol.set_current(current), unit)
+
+    async def enable_output(self, enable=True, unit=1):
+        return await self._run(hcp1020_protocol.set_output(enable), unit)
+
+    async def set_voltage_current_output(self, voltage, current, enable=True, unit=1):
+        return await self._run(hcp1020_protocol.set_voltage_current_output(voltage, current, enable), unit)
+
+    async def set_ovp_ocp(self, ovp_voltage, ocp_current, unit=1):
+        return await self._run(hcp1020_protocol.set_protection_values(ovp_voltage, ocp_current), unit)
+
+    async def query_voltage_current_status(self, unit=1):
+        return await self._run(hcp1020_protocol.query_voltage_current_status(), unit)
+
+    async def query_voltage_display(self, unit=1):
+        return await self._run(hcp1020_protocol.query_voltage_display(), unit)
+
+    async def query_current_display(self, unit=1):
+        return await self._run(hcp1020_protocol.query_current_display(), unit)
+
+    async def query_output_status(self, unit=1):
+        return await self._run(hcp1020_protocol.query_output_status(), unit)
+
+    async def query_voltage_current_status_display(self, unit=1):
+        return await self._run(hcp1020_protocol.query_voltage_current_status_display(), unit)
+
+
+# 使用示例：一个进程同时轮询多个串口上的电源
+if __name__ == "__main__":
+    PORTS = ['/dev/ttyUSB0', '/dev/ttyUSB1']
+
+    async def main():
+        transports = [await AsyncSerialTransport(port).open() for port in PORTS]
+        try:
+            psus = [AsyncHCP1020Controller(t, slave_id=1) for t in transports]
+            results = await asyncio.gather(*(psu.query_actual_values() for psu in psus))
+            for port, result in zip(PORTS, results):
+                print(f"{port}: {result}")
+        finally:
+            for t in transports:
+                await t.close()
+
+    asyncio.run(main())
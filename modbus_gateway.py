@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import time
+
+from crc16 import check_crc
+from instrumentation import Instrumentation
+from modbus_tcp import MBAP, DEFAULT_PORT, pdu_to_rtu, split_tcp_frame
+from rs485_bus import RS485Bus, request_priority
+
+log = logging.getLogger(__name__)
+
+# 本机MODBUS TCP -> RTU网关：网关进程独占串口，其他进程用MODBUS TCP连接本机端口共享同一条总线
+# 每个客户端连接可以流水线发送多个请求（按事务号区分），请求进入RS485Bus的优先级队列；
+# 并发的相同读请求只在总线上执行一次，短时间内重复的读请求直接用缓存的响应回答；
+# 写请求使对应单元号的缓存失效。指标：排队深度、进行中请求数、请求/总线时延直方图、命中和合并计数
+
+READ_FUNCTIONS = frozenset([0x03, 0x04])
+GATEWAY_PATH_UNAVAILABLE = 0x0A  # 单元号没有对应的总线
+GATEWAY_TARGET_FAILED = 0x0B     # 从站无响应或响应无效
+
+
+def _exception_pdu(function_code, code):
+    return bytes([function_code | 0x80, code])
+
+
+class ModbusGateway:
+    """MODBUS TCP服务端，把请求转发到RS-485总线
+
+    buses: RS485Bus（所有单元号共用）或 {单元号: RS485Bus}，键None为其他单元号使用的默认总线
+    cache_ttl: 读响应缓存时间（秒），0表示不缓存；max_pending: 每个连接最多同时进行的请求数
+    """
+
+    def __init__(self, buses, host='127.0.0.1', port=DEFAULT_PORT, cache_ttl=0.05, max_pending=64):
+        if isinstance(buses, RS485Bus):
+            buses = {None: buses}
+        self.buses = buses
+        self.host = host
+        self.port = port
+        self.cache_ttl = cache_ttl
+        self.max_pending = max_pending
+        self.instrumentation = Instrumentation()
+        self.clients = 0
+        self.pending = 0  # 已提交到总线、尚未返回的请求
+        self._cache = {}       # (单元号, 请求PDU) -> (时间, 响应PDU)
+        self._inflight = {}    # (单元号, 请求PDU) -> 正在执行的读请求的Future
+        self._generation = {}  # 单元号 -> 写入次数；读期间发生写入的响应不进缓存
+        self._tasks = set()    # 进行中的应答任务，保持引用直到完成
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        log.info("MODBUS TCP网关监听 %s:%d", self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _bus(self, unit):
+        return self.buses.get(unit, self.buses.get(None))
+
+    async def _handle_client(self, reader, writer):
+        self.clients += 1
+        slots = asyncio.Semaphore(self.max_pending)
+        buf = bytearray()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                buf += data
+                while True:
+                    frame = split_tcp_frame(buf)
+                    if frame is None:
+                        break
+                    transaction_id, unit, pdu, end = frame
+                    del buf[:end]
+                    await slots.acquire()  # 请求过多时暂停读取该连接
+                    task = asyncio.ensure_future(self._respond(writer, transaction_id, unit, pdu,
+                                                               time.perf_counter(), slots))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except ValueError as e:
+            log.warning("丢弃无效的MODBUS TCP连接: %s", e)
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _respond(self, writer, transaction_id, unit, pdu, received, slots):
+        try:
+            response = await self.request(unit, pdu)
+        finally:
+            slots.release()
+        self.instrumentation.observe('request', time.perf_counter() - received)
+        # 流水线请求按完成顺序应答，客户端按事务号对应
+        if not writer.is_closing():
+            writer.write(MBAP.pack(transaction_id, 0, len(response) + 1, unit) + response)
+
+    # 转发一个请求PDU，返回响应PDU；从站无响应时返回网关异常响应
+    async def request(self, unit, pdu):
+        inst = self.instrumentation
+        inst.count('requests')
+        function_code = pdu[0]
+        if function_code not in READ_FUNCTIONS:
+            self._invalidate(unit)
+            return await self._forward(unit, pdu, request_priority(pdu))  # 写入控制寄存器的优先
+
+        key = (unit, pdu)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            inst.count('cache_hits')
+            return cached[1]
+        shared = self._inflight.get(key)
+        if shared is not None:
+            inst.count('coalesced')
+            return await asyncio.shield(shared)
+
+        shared = self._inflight[key] = asyncio.get_running_loop().create_future()
+        generation = self._generation.get(unit, 0)
+        try:
+            response = await self._forward(unit, pdu, request_priority(pdu))
+        except BaseException:
+            shared.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+        shared.set_result(response)
+        if self.cache_ttl > 0 and response[0] == function_code and self._generation.get(unit, 0) == generation:
+            self._store(key, response)
+        return response
+
+    def _store(self, key, response):
+        now = time.monotonic()
+        if len(self._cache) >= 1024:
+            self._cache = {k: v for k, v in self._cache.items() if now - v[0] < self.cache_ttl}
+        self._cache[key] = (now, response)
+
+    # 写入前调用：丢弃该单元号的缓存，之后的读请求不再合并到写入前发出的读请求上
+    def _invalidate(self, unit):
+        self._generation[unit] = self._generation.get(unit, 0) + 1
+        for table in (self._cache, self._inflight):
+            for key in [key for key in table if key[0] == unit]:
+                del table[key]
+
+    async def _forward(self, unit, pdu, priority):
+        inst = self.instrumentation
+        function_code = pdu[0]
+        bus = self._bus(unit)
+        if bus is None:
+            inst.count('unroutable')
+            return _exception_pdu(function_code, GATEWAY_PATH_UNAVAILABLE)
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wrap_future(bus.submit(unit, pdu_to_rtu(unit, pdu), priority))
+        except Exception as e:
+            log.warning("单元%d请求失败: %s", unit, e)
+            response = b''
+        finally:
+            self.pending -= 1
+        inst.observe('bus', time.perf_counter() - start)  # 含总线排队时间
+        if not response:
+            inst.count('timeouts')
+            return _exception_pdu(function_code, GATEWAY_TARGET_FAILED)
+        if len(response) < 4 or not check_crc(response) or response[0] != unit \
+                or response[1] & 0x7F != function_code:
+            inst.count('bad_responses')
+            return _exception_pdu(function_code, GATEWAY_TARGET_FAILED)
+        return bytes(response[1:-2])
+
+    # 总线队列中等待执行的事务数
+    def queue_depth(self):
+        return sum(bus.queue_depth() for bus in set(self.buses.values()))
+
+    def metrics(self):
+        result = self.instrumentation.to_dict()
+        result.update({
+            'clients': self.clients,
+            'pending': self.pending,
+            'queue_depth': self.queue_depth(),
+            'cache_entries': len(self._cache)
+        })
+        return result
+
+    # Prometheus文本格式：时延直方图、事件计数和当前值
+    def to_prometheus(self, prefix='modbus_gateway'):
+        lines = [self.instrumentation.to_prometheus(prefix).rstrip('\n')]
+        for name, value in (('clients', self.clients), ('pending', self.pending),
+                            ('queue_depth', self.queue_depth()), ('cache_entries', len(self._cache))):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # 最简单的HTTP指标端点：/metrics返回Prometheus文本，其他路径返回JSON
+    async def _handle_metrics(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            path = request.split()[1].decode() if len(request.split()) > 1 else '/'
+            if path == '/metrics':
+                body, content_type = self.to_prometheus(), 'text/plain; version=0.0.4'
+            else:
+                body, content_type = json.dumps(self.metrics(), indent=2), 'application/json'
+            body = body.encode('utf-8')
+            writer.write(f"HTTP/1.0 200 OK\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start_metrics(self, port, host=None):
+        return await asyncio.start_server(self._handle_metrics, host or self.host, port)
+
+
+# 串口参数 '/dev/ttyUSB0' 或 '/dev/ttyUSB0=1,2'（只转发单元号1、2）
+def _parse_bus_spec(spec):
+    port, _, units = spec.partition('=')
+    return port, [int(u) for u in units.split(',')] if units else [None]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="本机MODBUS TCP -> RTU网关")
+    parser.add_argument('ports', nargs='*', help="串口，可写成 端口=单元号,单元号 指定转发到该串口的单元号")
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--timeout', type=float, default=1.0, help="等待从站响应的超时时间（秒）")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址，默认只接受本机连接")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="MODBUS TCP端口")
+    parser.add_argument('--cache-ttl', type=float, default=0.05, help="读响应缓存时间（秒），0为不缓存")
+    parser.add_argument('--metrics-port', type=int, help="HTTP指标端口（/metrics为Prometheus格式）")
+    parser.add_argument('--simulate', help="用hcp1020_sim模拟的从站代替串口，逗号分隔的从站地址")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    buses = {}
+    if args.simulate:
+        from hcp1020_sim import HCP1020Simulator, SimulatedSerial
+        simulators = [HCP1020Simulator(int(sid)) for sid in args.simulate.split(',')]
+        buses[None] = RS485Bus(SimulatedSerial(simulators, args.baudrate), args.baudrate, args.timeout)
+    for spec in args.ports:
+        port, units = _parse_bus_spec(spec)
+        bus = RS485Bus(port, args.baudrate, args.timeout)
+        for unit in units:
+            buses[unit] = bus
+    if not buses:
+        parser.error("需要至少一个串口或--simulate")
+
+    gateway = ModbusGateway(buses, args.host, args.port, args.cache_ttl)
+
+    async def run():
+        if args.metrics_port:
+            await gateway.start_metrics(args.metrics_port)
+        await gateway.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for bus in set(buses.values()):
+            bus.close()
+        print(json.dumps(gateway.metrics(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import struct
+import time
+from crc16 import crc16, crc16_bytes, check_crc
+
+# MODBUS RTU帧编解码，同步/异步控制器共用
+
+_HEADER = struct.Struct('>BBHH')
+_CRC = struct.Struct('<H')
+MAX_FRAME = 256  # MODBUS RTU帧最大长度
+
+# MODBUS RTU帧间静默时间（3.5个字符时间），波特率高于19200时规范固定为1.75ms
+def frame_silence(baudrate):
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11 / baudrate  # 每个字符按11位计算（起始位+8数据位+校验/停止位）
+
+# 根据响应头（地址、功能码、字节计数/异常码）计算完整响应帧长度，未知功能码返回None
+def expected_response_length(header):
+    function_code = header[1]
+    if function_code & 0x80:  # 异常响应：地址+功能码+异常码+CRC
+        return 5
+    if function_code == 0x03:  # 读寄存器：地址+功能码+字节数+数据+CRC
+        return 5 + header[2]
+    if function_code in (0x06, 0x10):  # 写寄存器：回显地址和值/数量
+        return 8
+    return None
+
+class ModbusError(Exception):
+    """MODBUS通信错误基类"""
+
+
+class ModbusTimeoutError(ModbusError):
+    """超时未收到响应"""
+
+
+class ModbusCRCError(ModbusError):
+    """响应CRC校验失败"""
+
+
+class ModbusFrameError(ModbusError):
+    """响应不完整，或地址、功能码、回显内容与请求不符"""
+
+
+# 异常码说明
+EXCEPTION_MESSAGES = {
+    0x01: "非法功能码",
+    0x02: "非法数据地址",
+    0x03: "非法数据值",
+    0x04: "从站设备故障",
+    0x06: "从站设备忙",
+    0x0A: "网关路径不可用",
+    0x0B: "网关后的从站无响应"
+}
+
+
+class ModbusExceptionResponse(ModbusError):
+    """从站返回异常响应"""
+
+    def __init__(self, function_code, exception_code):
+        self.function_code = function_code
+        self.exception_code = exception_code
+        message = EXCEPTION_MESSAGES.get(exception_code, "未知异常")
+        super().__init__(f"功能码{function_code:#04x}异常响应{exception_code:#04x}: {message}")
+
+
+# 校验响应是否属于本次请求，不符时抛出对应的ModbusError
+def validate_response(response, slave_id, function_code, register, value=None, count=1):
+    if not response:
+        raise ModbusTimeoutError("等待响应超时")
+    if len(response) < 5:
+        raise ModbusFrameError(f"响应帧不完整: {bytes(response).hex()}")
+    if response[0] != slave_id or response[1] & 0x7F != function_code:
+        raise ModbusFrameError(f"响应地址或功能码不符: {bytes(response).hex()}")
+    if len(response) != expected_response_length(response):
+        raise ModbusFrameError(f"响应帧长度错误: {bytes(response).hex()}")
+    if not check_crc(response):
+        raise ModbusCRCError(f"响应CRC错误: {bytes(response).hex()}")
+    if response[1] & 0x80:
+        raise ModbusExceptionResponse(function_code, response[2])
+    if function_code == 0x03:
+        if response[2] != count * 2:
+            raise ModbusFrameError(f"响应寄存器数量不符: {bytes(response).hex()}")
+    elif _HEADER.unpack_from(response)[2:] != (register, value if function_code == 0x06 else count):
+        raise ModbusFrameError(f"写响应回显不符: {bytes(response).hex()}")
+
+# 在收到的字节流中查找本从站、本功能码的CRC正确的帧（用于丢弃过期或错误字节后重新同步）
+def iter_frames(data, slave_id, function_code):
+    for offset in range(len(data) - 4):
+        if data[offset] != slave_id or data[offset + 1] & 0x7F != function_code:
+            continue
+        length = expected_response_length(data[offset:offset + 3])
+        if length is None or offset + length > len(data):
+            continue
+        frame = data[offset:offset + length]
+        if check_crc(frame):
+            yield frame
+
+# 构造带CRC的请求帧
+def build_request(slave_id, function_code, register, value=None, values=None, read_length=1):
+    if function_code == 0x06:  # 写单个寄存器
+        frame = struct.pack('>BBHH', slave_id, function_code, register, value)
+    elif function_code == 0x03:  # 读寄存器
+        frame = struct.pack('>BBHH', slave_id, function_code, register, read_length)
+    elif function_code == 0x10:  # 写多个寄存器
+        frame = struct.pack('>BBHHB%dH' % len(values),
+            slave_id,
+            function_code,
+            register,
+            len(values),      # 寄存器数量
+            len(values) * 2,  # 字节数
+            *values
+        )
+    else:
+        raise ValueError(f"不支持的功能码: {function_code:#04x}")
+    return frame + crc16_bytes(frame)
+
+# 预先编码一组写单个寄存器(0x06)帧到一块连续缓冲区，第i帧为 buf[8*i:8*i+8]
+# 用于闭环调节等需要在热路径上直接取帧发送的场合
+WRITE_FRAME_SIZE = 8
+
+def encode_write_frames(slave_id, register, values):
+    buf = bytearray(WRITE_FRAME_SIZE * len(values))
+    view = memoryview(buf)
+    for i, value in enumerate(values):
+        offset = i * WRITE_FRAME_SIZE
+        _HEADER.pack_into(buf, offset, slave_id, 0x06, register, value)
+        _CRC.pack_into(buf, offset + 6, crc16(view[offset:offset + 6]))
+    return buf
+
+# 构造读寄存器响应帧（用于影子缓存命中和设备模拟）
+def build_read_response(slave_id, values):
+    frame = struct.pack('>BBB%dH' % len(values), slave_id, 0x03, len(values) * 2, *values)
+    return frame + crc16_bytes(frame)
+
+# 构造写寄存器响应帧：0x06回显地址和值，0x10回显起始地址和数量
+def build_write_response(slave_id, function_code, register, value):
+    frame = struct.pack('>BBHH', slave_id, function_code, register, value)
+    return frame + crc16_bytes(frame)
+
+# 按寄存器数量缓存的struct对象，避免每次重新解析格式串
+_struct_cache = {}
+
+def _register_struct(prefix, count):
+    key = (prefix, count)
+    packer = _struct_cache.get(key)
+    if packer is None:
+        packer = _struct_cache[key] = struct.Struct('%s%dH' % (prefix, count))
+    return packer
+
+# 解析读寄存器响应，返回寄存器值元组；响应不完整返回None
+# 直接从响应缓冲区（bytes或memoryview）解包，不切片复制
+def decode_registers(response, count):
+    if len(response) < 5 + count * 2 or response[1] != 0x03 or response[2] != count * 2:
+        return None
+    return _register_struct('>', count).unpack_from(response, 3)
+
+
+
+def _readinto(ser, view):
+    readinto = getattr(ser, 'readinto', None)
+    if readinto is not None:
+        return readinto(view)
+    data = ser.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+
+class FrameCodec:
+    """复用预分配缓冲区的帧编解码：请求用pack_into写入发送缓冲区，响应用readinto读入接收缓冲区
+
+    encode/read_frame返回的memoryview指向内部缓冲区，下一次调用后失效，需要保留时用bytes()复制
+    读响应时先读响应头确定帧长，读满或出现帧间静默即返回；串口需设置timeout（等待首字节）
+    和inter_byte_timeout（帧间静默）
+    """
+
+    def __init__(self):
+        self.tx = bytearray(MAX_FRAME)
+        self.rx = bytearray(MAX_FRAME)
+        self._tx_view = memoryview(self.tx)
+        self._rx_view = memoryview(self.rx)
+
+    def encode(self, slave_id, function_code, register, value=None, values=None, read_length=1):
+        buf = self.tx
+        if function_code == 0x06:  # 写单个寄存器
+            _HEADER.pack_into(buf, 0, slave_id, function_code, register, value)
+            length = 6
+        elif function_code == 0x03:  # 读寄存器
+            _HEADER.pack_into(buf, 0, slave_id, function_code, register, read_length)
+            length = 6
+        elif function_code == 0x10:  # 写多个寄存器
+            count = len(values)
+            _register_struct('>BBHHB', count).pack_into(
+                buf, 0, slave_id, function_code, register, count, count * 2, *values)
+            length = 7 + count * 2
+        else:
+            raise ValueError(f"不支持的功能码: {function_code:#04x}")
+        _CRC.pack_into(buf, length, crc16(self._tx_view[:length]))
+        return self._tx_view[:length + 2]
+
+    # 读取响应头，返回读到的字节数
+    def read_header(self, ser):
+        return _readinto(ser, self._rx_view[:3])
+
+    # 根据响应头读取剩余部分，返回整帧的memoryview
+    def read_rest(self, ser, received):
+        view = self._rx_view
+        if received < 3:
+            return view[:received]
+        length = expected_response_length(view)
+        if length is None:
+            length = MAX_FRAME  # 未知功能码，读到帧间静默为止
+        received += _readinto(ser, view[3:length])
+        return view[:received]
+
+    def read_frame(self, ser):
+        return self.read_rest(ser, self.read_header(ser))
+
+# 从串口按帧读取一个响应，返回bytes；分帧规则见FrameCodec，反复读取时直接使用FrameCodec复用缓冲区
+def read_frame(ser):
+    return bytes(FrameCodec().read_frame(ser))
+
+# 读取并丢弃线路上的字节，直到连续quiet秒没有数据；wait为等待第一个字节的最长时间（不小于quiet）
+# 返回丢弃的字节数
+def settle_line(ser, wait, quiet):
+    timeout = ser.timeout
+    discarded = 0
+    try:
+        ser.timeout = max(wait, quiet)
+        while discarded < 4 * MAX_FRAME:  # 线路持续有数据时不无限等待
+            data = ser.read(MAX_FRAME)
+            if not data:
+                break
+            discarded += len(data)
+            ser.timeout = quiet
+    finally:
+        ser.timeout = timeout
+    return discarded
+
+# 上一个请求超时后，发送function_code请求前等待其迟到响应的时间（秒），late_until为迟到响应可能到达的最晚时刻
+# 从站可能只是处理得慢：FC03响应不含寄存器地址，迟到的读响应会被当作本次读取的结果，读请求前要等到late_until；
+# 写响应带回显，迟到的响应能被校验识别并重新同步，写请求前只丢弃已到达的字节
+def late_response_wait(function_code, late_until, now):
+    return max(late_until - now, 0.0) if function_code in (0x03, 0x04) else 0.0
+
+# 按late_response_wait丢弃迟到的响应，直到线路静默quiet秒；deadline不为None时最多等到deadline
+# 返回 (新的late_until, 能否发送)：迟到的响应已丢弃或等待窗口已结束时late_until为None，
+# 读请求在deadline前等不到时不能发送。时刻均为time.monotonic()
+def settle_after_timeout(ser, function_code, late_until, quiet, deadline=None):
+    now = time.monotonic()
+    wait = late_response_wait(function_code, late_until, now)
+    blocked = deadline is not None and now + wait > deadline
+    if settle_line(ser, deadline - now if blocked else wait, quiet) or (not blocked and now + wait >= late_until):
+        return None, True
+    return late_until, not blocked
+
+# 读寄存器规划：把若干 (起始地址, 数量) 请求合并成尽量少的FC03事务
+# 重叠或相邻（间隔不超过max_gap个寄存器）的请求合并，单次事务不超过max_count个寄存器
+def plan_register_reads(ranges, max_count=125, max_gap=0):
+    merged = []
+    for start, count in sorted(ranges):
+        end = start + count
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    plan = []
+    for start, end in merged:
+        while start < end:
+            count = min(end - start, max_count)
+            plan.append((start, count))
+            start += count
+    return plan
+
+# 遥测寄存器块：实际值/设定值/保护值(0x0000-0x0007) 与 恒功率参数(0x0030-0x0034)
+TELEMETRY_BLOCKS = [(0x0000, 8), (0x0030, 5)]
@@ -0,0 +1,125 @@
+import socket
+import struct
+import time
+
+from crc16 import crc16_bytes
+
+# MODBUS TCP帧与RTU帧互转，以及按串口接口收发的TCP客户端端口
+# MODBUS TCP帧 = MBAP头(事务号, 协议号0, 后续长度, 单元号) + PDU；RTU帧 = 从站地址 + PDU + CRC
+# 网关(modbus_gateway.py)把单元号当作RTU从站地址转发到串口
+
+MBAP = struct.Struct('>HHHB')
+DEFAULT_PORT = 5020  # 502需要管理员权限，本机网关默认使用5020
+MAX_PDU = 253
+
+
+# 'tcp://host:port' -> (host, port)；不是TCP地址时返回None
+def parse_tcp_url(port):
+    if not isinstance(port, str) or not port.startswith('tcp://'):
+        return None
+    host, _, number = port[len('tcp://'):].rpartition(':')
+    if not host:
+        return number or '127.0.0.1', DEFAULT_PORT
+    return host, int(number)
+
+
+# RTU请求帧 -> MODBUS TCP帧（去掉CRC，加MBAP头）
+def rtu_to_tcp(frame, transaction_id):
+    pdu = bytes(frame[1:-2])
+    return MBAP.pack(transaction_id, 0, len(pdu) + 1, frame[0]) + pdu
+
+
+# 单元号 + PDU -> RTU帧
+def pdu_to_rtu(unit, pdu):
+    body = bytes([unit]) + pdu
+    return body + crc16_bytes(body)
+
+
+# 从字节流中取出一个完整的MODBUS TCP帧，返回 (事务号, 单元号, PDU, 帧长)；不完整时返回None
+def split_tcp_frame(buf):
+    if len(buf) < MBAP.size:
+        return None
+    transaction_id, protocol, length, unit = MBAP.unpack_from(buf)
+    if protocol != 0 or not 2 <= length <= MAX_PDU + 1:
+        raise ValueError(f"无效的MBAP头: {bytes(buf[:MBAP.size]).hex()}")
+    end = MBAP.size + length - 1
+    if len(buf) < end:
+        return None
+    return transaction_id, unit, bytes(buf[MBAP.size:end]), end
+
+
+class TcpRtuPort:
+    """经MODBUS TCP网关访问从站的"串口"：write()收RTU请求帧，read()返回RTU响应帧
+
+    接口与serial.Serial的读写部分一致，HCP1020Controller可以直接使用；
+    事务号与最近一次请求不一致的响应（超时后迟到的）直接丢弃
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=1):
+        self.host = host
+        self.port = f'tcp://{host}:{port}'
+        self.timeout = timeout
+        self.inter_byte_timeout = 0.0  # TCP按帧到达，不需要帧间静默
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.is_open = True
+        self._transaction_id = 0
+        self._stream = bytearray()  # 未解析的TCP字节
+        self._rx = bytearray()      # 已转换为RTU帧、待读取的字节
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def write(self, frame):
+        self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+        self._sock.sendall(rtu_to_tcp(frame, self._transaction_id))
+        return len(frame)
+
+    def flush(self):
+        pass
+
+    # 接收到与当前事务号一致的响应为止，超时返回False
+    def _receive(self):
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        while True:
+            frame = split_tcp_frame(self._stream)
+            if frame is not None:
+                transaction_id, unit, pdu, end = frame
+                del self._stream[:end]
+                if transaction_id == self._transaction_id:
+                    self._rx += pdu_to_rtu(unit, pdu)
+                    return True
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._sock.settimeout(remaining)
+            try:
+                data = self._sock.recv(4096)
+            except socket.timeout:
+                return False
+            if not data:
+                raise ConnectionError(f"网关已断开: {self.port}")
+            self._stream += data
+
+    def read(self, size=1):
+        if not self._rx and size and not self._receive():
+            return b''
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def reset_input_buffer(self):
+        # 流中残留的旧响应按事务号丢弃
+        self._rx.clear()
+
+    def close(self):
+        if self.is_open:
+            self._sock.close()
+            self.is_open = False
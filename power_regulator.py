@@ -0,0 +1,221 @@
+import threading
+import time
+from array import array
+
+from instrumentation import percentile
+from Modbus import sleep_until
+from realtime import fast_switching
+from modbus_rtu import build_request, decode_registers, encode_write_frames, ModbusError, WRITE_FRAME_SIZE
+from register_map import register_address, to_raw, from_raw, TRIP_BITS
+
+# 主机侧恒功率闭环调节：设备没有可用的CP模式时，由主机按固定周期调整电压或电流设定值
+# 每个周期一次块读实际电压/电流/状态(0x0000-0x0002)，由实测值估算负载电阻，按 P=V²/R（调电压）
+# 或 P=I²R（调电流）求出目标设定值，经增益平滑、限速和OVP/OCP限幅后写入。
+# 控制循环运行在独立的定时线程中，周期按单调时钟的绝对截止时间推进；
+# 读请求帧和设定值范围内所有写入帧在启动时预先编码，循环中只查表发送。
+# 其他线程占用CPU时，每次串口阻塞返回后要等GIL切换间隔（默认5ms）才能继续，一个周期有多次阻塞；
+# 可以在运行期间把解释器的线程切换间隔调小（switch_interval，见realtime.fast_switching）。调节期间其他线程仍可使用同一控制器，
+# 事务由控制器的事务锁串行执行
+
+VOLTAGE_REGISTER = register_address('voltage')
+MODES = {'voltage': 'set_voltage', 'current': 'set_current'}
+
+
+class PowerRegulator:
+    """恒功率闭环调节器，start()后在后台运行，stop()停止并返回report()
+
+    mode: 'voltage'调节电压设定值（电流限值需预先设置得足够大），'current'调节电流设定值
+    period: 控制周期（秒）；slew_rate: 设定值最大变化速率（V/s或A/s）
+    gain: 每个周期向目标设定值靠近的比例（0-1）；margin: 相对OVP/OCP的余量，
+    设定值和由负载电阻预测的另一路输出都不超过保护值*margin
+    tolerance: 判定稳定的相对功率误差；输出需已打开且有负载电流，无电流时保持设定值不变
+    switch_interval: 控制线程运行期间的sys.setswitchinterval值（秒，如0.0005），影响整个进程，默认不修改
+    """
+
+    def __init__(self, controller, watts, mode='voltage', period=0.02, slew_rate=10.0, gain=0.5,
+                 margin=0.95, tolerance=0.02, switch_interval=None):
+        if mode not in MODES:
+            raise ValueError(f"未知的调节方式: {mode}")
+        self.controller = controller
+        self.target = watts
+        self.mode = mode
+        self.period = period
+        self.slew_rate = slew_rate
+        self.gain = gain
+        self.margin = margin
+        self.tolerance = tolerance
+        self.switch_interval = switch_interval
+        self.setpoint = None
+        self._reset()
+        self._name = MODES[mode]
+        self._register = register_address(self._name)
+        self._read_frame = build_request(controller.slave_id, 0x03, VOLTAGE_REGISTER, read_length=3)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # 读取当前设定值和保护值，预编码写入帧，启动定时线程
+    def start(self):
+        ctrl = self.controller
+        set_voltage, set_current, _, ovp, ocp = ctrl.read_registers(register_address('set_voltage'), 5)
+        self.ovp = from_raw('ovp', ovp)
+        self.ocp = from_raw('ocp', ocp)
+        self.limit = (self.ovp if self.mode == 'voltage' else self.ocp) * self.margin
+        max_raw = to_raw(self._name, self.limit)
+        # 0到限幅值之间每个寄存器值对应一帧，第raw帧写入raw
+        self._frames = memoryview(encode_write_frames(ctrl.slave_id, self._register, range(max_raw + 1)))
+        self._reset()
+        raw = set_voltage if self.mode == 'voltage' else set_current
+        if raw > max_raw:
+            # 设备上的设定值已超过限幅值，先写入限幅值
+            offset = max_raw * WRITE_FRAME_SIZE
+            ctrl.send_frame(self._frames[offset:offset + WRITE_FRAME_SIZE], 0x06, self._register, max_raw)
+            self.writes += 1
+            raw = max_raw
+        self._raw = raw
+        self.setpoint = from_raw(self._name, raw)
+
+        self._started = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'power-regulator-{ctrl.slave_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    # 清空运行记录，未启动时report()也可以调用
+    def _reset(self):
+        self.times = array('d')        # 每次成功读取的时间（相对开始，秒）
+        self.powers = array('d')       # 实测功率
+        self.lateness = array('d')     # 周期开始相对截止时间的延迟
+        self.cycle_times = array('d')  # 每个周期的执行时间
+        self.writes = self.errors = self.overruns = self.no_load_cycles = 0
+        self.trip_status = None
+        self.last_error = None
+        self._target_time = 0.0
+
+    # 运行中修改目标功率，稳定时间从修改时刻重新计算
+    def set_target(self, watts):
+        self.target = watts
+        self._target_time = time.monotonic() - self._started
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.report()
+
+    # 运行duration秒后停止，返回报告
+    def run(self, duration):
+        self.start()
+        time.sleep(duration)
+        return self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # 控制线程：切换间隔只在线程运行期间调小，线程因任何原因退出都会恢复
+    def _run(self):
+        with fast_switching(self.switch_interval):
+            self._loop()
+
+    def _loop(self):
+        period = self.period
+        deadline = self._started
+        while not self._stop.is_set():
+            sleep_until(deadline)
+            begin = time.monotonic()
+            try:
+                tripped = self._cycle(begin - self._started)
+            except ModbusError as e:
+                self.errors += 1  # 通信失败的周期不调整，下个周期继续
+                self.last_error = e
+                tripped = False
+            except Exception as e:
+                # 串口断开等无法恢复的错误：记录后停止调节，running变为False
+                self.errors += 1
+                self.last_error = e
+                break
+            end = time.monotonic()
+            self.lateness.append(begin - deadline)
+            self.cycle_times.append(end - begin)
+            if tripped:
+                break
+            deadline += period
+            if end > deadline:
+                # 执行超过一个周期：跳过已错过的周期，不连续补跑
+                missed = int((end - deadline) / period) + 1
+                self.overruns += missed
+                deadline += missed * period
+
+    # 一个控制周期，保护触发时返回True
+    def _cycle(self, now):
+        ctrl = self.controller
+        voltage_raw, current_raw, status = decode_registers(
+            ctrl.send_frame(self._read_frame, 0x03, VOLTAGE_REGISTER, count=3), 3)
+        if status & TRIP_BITS:
+            self.trip_status = status
+            return True
+        voltage = from_raw('voltage', voltage_raw)
+        current = from_raw('current', current_raw)
+        self.times.append(now)
+        self.powers.append(voltage * current)
+        if not voltage or not current:
+            self.no_load_cycles += 1
+            return False
+
+        resistance = voltage / current
+        if self.mode == 'voltage':
+            desired = min((self.target * resistance) ** 0.5, self.ocp * self.margin * resistance)
+        else:
+            desired = min((self.target / resistance) ** 0.5, self.ovp * self.margin / resistance)
+        setpoint = self.setpoint + self.gain * (desired - self.setpoint)
+        step = self.slew_rate * self.period
+        setpoint = min(max(setpoint, self.setpoint - step, 0.0), self.setpoint + step, self.limit)
+        self.setpoint = setpoint
+
+        raw = to_raw(self._name, setpoint)
+        if raw != self._raw:
+            offset = raw * WRITE_FRAME_SIZE
+            ctrl.send_frame(self._frames[offset:offset + WRITE_FRAME_SIZE], 0x06, self._register, raw)
+            self._raw = raw
+            self.writes += 1
+        return False
+
+    # 从目标设定（或修改）时刻起，到功率进入误差带且之后不再离开所用的时间；未稳定返回None
+    def settling_time(self):
+        band = self.tolerance * abs(self.target)
+        settled = None
+        for t, power in zip(self.times, self.powers):
+            if t < self._target_time:
+                continue
+            if abs(power - self.target) > band:
+                settled = None
+            elif settled is None:
+                settled = t
+        return settled - self._target_time if settled is not None else None
+
+    def report(self):
+        lateness = sorted(self.lateness)
+        cycle_times = sorted(self.cycle_times)
+        cycles = len(cycle_times)
+        return {
+            'target': self.target,
+            'mode': self.mode,
+            'period': self.period,
+            'cycles': cycles,
+            'writes': self.writes,
+            'errors': self.errors,
+            'overruns': self.overruns,            # 错过的周期数
+            'no_load_cycles': self.no_load_cycles,
+            'trip_status': self.trip_status,       # 保护触发时的状态字，否则为None
+            'power': self.powers[-1] if self.powers else None,
+            'setpoint': self.setpoint,
+            'settling_time': self.settling_time(),
+            'jitter_p50': percentile(lateness, 50),
+            'jitter_p99': percentile(lateness, 99),
+            'jitter_max': lateness[-1] if lateness else 0.0,
+            'cycle_time_p50': percentile(cycle_times, 50),
+            'cycle_time_p99': percentile(cycle_times, 99),
+            'cycle_time_max': cycle_times[-1] if cycle_times else 0.0,
+            'utilization': sum(cycle_times) / (cycles * self.period) if cycles else 0.0
+        }
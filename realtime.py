@@ -0,0 +1,34 @@
+import contextlib
+import sys
+import threading
+
+# 定时循环（power_regulator、waveform）使用的进程级解释器设置
+# 其他线程占用CPU时，串口阻塞返回后要等一个线程切换间隔（sys.getswitchinterval()，默认5ms）才能继续；
+# 调小切换间隔影响整个进程，默认不启用，由调用者显式传入
+
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_saved = None
+
+
+# 运行期间调小解释器的线程切换间隔，interval为None时不修改
+# 多个调节器、波形流可以同时使用：取其中最小的间隔，最后一个退出时才恢复原值
+@contextlib.contextmanager
+def fast_switching(interval):
+    global _switch_users, _switch_saved
+    if interval is None:
+        yield
+        return
+    with _switch_lock:
+        if not _switch_users:
+            _switch_saved = sys.getswitchinterval()
+        _switch_users += 1
+        if interval < sys.getswitchinterval():
+            sys.setswitchinterval(interval)
+    try:
+        yield
+    finally:
+        with _switch_lock:
+            _switch_users -= 1
+            if not _switch_users:
+                sys.setswitchinterval(_switch_saved)
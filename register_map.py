@@ -0,0 +1,130 @@
+from collections import namedtuple
+
+# HCP1020寄存器表：地址、比例、单位和位定义集中在这里，同步/异步控制器、遥测采样和记录器共用
+# 单样本解析用纯Python；大批量样本用decode_samples/decode_records一次性向量化解析（需要NumPy）
+
+# scale: 物理值 = 寄存器值 / scale，None表示原始值
+# bits: 单个掩码时解析为bool；(名称, 掩码)序列时解析为各位的bool
+Register = namedtuple('Register', ['name', 'address', 'scale', 'unit', 'bits'])
+
+# 状态寄存器(0x0002)各位
+STATUS_BITS = (
+    ('output_on', 0x01),    # 位0：输出状态
+    ('cv_mode', 0x02),      # 位1：恒压模式
+    ('cc_mode', 0x04),      # 位2：恒流模式
+    ('ovp_tripped', 0x08),  # 位3：OVP触发
+    ('ocp_tripped', 0x10),  # 位4：OCP触发
+    ('otp_tripped', 0x20)   # 位5：OTP触发
+)
+
+# 控制寄存器(0x0005)各位
+CONTROL_BITS = (
+    ('output_on', 0x0001),         # 位0：输出开关
+    ('ovp_enable', 0x0008),        # 位3：OVP功能
+    ('ocp_enable', 0x0010),        # 位4：OCP功能
+    ('clear_protection', 0x0040),  # 位6：清除保护
+    ('keyboard_lock', 0x4000)      # 位14：键盘锁定
+)
+
+STATUS_MASKS = dict(STATUS_BITS)
+CONTROL_MASKS = dict(CONTROL_BITS)
+TRIP_BITS = STATUS_MASKS['ovp_tripped'] | STATUS_MASKS['ocp_tripped'] | STATUS_MASKS['otp_tripped']
+
+REGISTERS = (
+    Register('voltage', 0x0000, 100, 'V', None),            # 实际电压（10mV单位）
+    Register('current', 0x0001, 1000, 'A', None),           # 实际电流（1mA单位）
+    Register('status', 0x0002, None, None, STATUS_BITS),    # 状态字
+    Register('set_voltage', 0x0003, 100, 'V', None),        # 设定电压
+    Register('set_current', 0x0004, 1000, 'A', None),       # 设定电流
+    Register('control', 0x0005, None, None, None),          # 控制字
+    Register('ovp', 0x0006, 100, 'V', None),                # 过压保护值
+    Register('ocp', 0x0007, 1000, 'A', None),               # 过流保护值
+    Register('line_compensation', 0x0030, None, None, None),  # 线阻补偿
+    Register('load_resistance', 0x0031, None, None, None),  # 负载阻值
+    Register('cp_mode', 0x0032, None, None, 0x0001),        # 恒功率模式
+    Register('power', 0x0034, 100, 'W', None)               # 功率设定（10mW单位）
+)
+
+REGISTER_MAP = {reg.name: reg for reg in REGISTERS}
+
+
+def register_address(name):
+    return REGISTER_MAP[name].address
+
+
+# 物理值 -> 寄存器值
+def to_raw(name, value):
+    return int(value * REGISTER_MAP[name].scale)
+
+
+# 寄存器值 -> 物理值
+def from_raw(name, raw):
+    scale = REGISTER_MAP[name].scale
+    return raw / scale if scale else raw
+
+
+def decode_bits(word, bits=STATUS_BITS):
+    return {name: bool(word & mask) for name, mask in bits}
+
+
+# 按名称构造位字段，如 encode_bits(CONTROL_BITS, output_on=True, ovp_enable=True)
+def encode_bits(bits=CONTROL_BITS, **flags):
+    masks = dict(bits)
+    word = 0
+    for name, value in flags.items():
+        if value:
+            word |= masks[name]
+    return word
+
+
+# 解析状态寄存器(0x0002)
+def decode_status(status):
+    return decode_bits(status, STATUS_BITS)
+
+
+def _decode(reg, raw):
+    if reg.bits is None:
+        return raw / reg.scale if reg.scale else raw
+    if isinstance(reg.bits, int):
+        return bool(raw & reg.bits)
+    return decode_bits(raw, reg.bits)
+
+
+# 把寄存器 {地址: 值} 解析为物理值，只解析表中存在且已读取的寄存器
+def decode_telemetry(regs):
+    return {reg.name: _decode(reg, regs[reg.address]) for reg in REGISTERS if reg.address in regs}
+
+
+# 批量解析：registers为二维数组，每行一个样本，第j列为base_register+j的原始值
+# 返回 {名称: NumPy数组}，位字段展开为各位的bool数组（如output_on、ovp_tripped）
+def decode_samples(registers, base_register=0x0000):
+    import numpy as np
+    registers = np.asarray(registers)
+    if registers.ndim != 2:
+        raise ValueError("registers必须是二维数组（样本数 x 寄存器数）")
+    result = {}
+    for reg in REGISTERS:
+        column = reg.address - base_register
+        if not 0 <= column < registers.shape[1]:
+            continue
+        raw = registers[:, column]
+        if reg.bits is None:
+            result[reg.name] = raw / reg.scale if reg.scale else raw
+        elif isinstance(reg.bits, int):
+            result[reg.name] = (raw & reg.bits) != 0
+        else:
+            for name, mask in reg.bits:
+                result[name] = (raw & mask) != 0
+    return result
+
+
+# 与decode_samples相同，返回结构化数组，每个样本一条记录
+def decode_records(registers, base_register=0x0000):
+    import numpy as np
+    columns = decode_samples(registers, base_register)
+    if not columns:
+        raise ValueError("registers中没有寄存器表里的寄存器")
+    records = np.empty(len(registers), dtype=[(name, column.dtype) for name, column in columns.items()])
+    for name, column in columns.items():
+        records[name] = column
+    return records
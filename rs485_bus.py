@@ -0,0 +1,231 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from modbus_rtu import frame_silence, expected_response_length, settle_after_timeout, FrameCodec
+from Modbus import HCP1020Controller
+from register_map import register_address
+
+# 多从站RS-485总线调度：一个总线对象独占串口，按优先级排队执行各从站的事务
+
+# 事务优先级（数值越小越先执行）
+PRIORITY_CONTROL = 0   # 控制字写入（关输出、清除保护等）
+PRIORITY_WRITE = 1     # 其他写寄存器
+PRIORITY_POLL = 2      # 遥测轮询读
+
+CONTROL_REGISTER = register_address('control')
+
+
+# 请求PDU（从功能码起）的优先级：写入范围包含控制寄存器（输出开关、清除保护、键盘锁）时最先执行
+def request_priority(pdu):
+    function_code = pdu[0]
+    if function_code in (0x03, 0x04):
+        return PRIORITY_POLL
+    if function_code not in (0x06, 0x10) or len(pdu) < 5:
+        return PRIORITY_WRITE
+    register = (pdu[1] << 8) | pdu[2]
+    count = (pdu[3] << 8) | pdu[4] if function_code == 0x10 else 1
+    return PRIORITY_CONTROL if register <= CONTROL_REGISTER < register + count else PRIORITY_WRITE
+
+
+def _new_stats():
+    return {
+        'transactions': 0,
+        'errors': 0,          # 超时或帧不完整
+        'bytes_sent': 0,
+        'bytes_received': 0,
+        'busy_time': 0.0,     # 占用总线时间（发送到收完响应）
+        'queue_time': 0.0     # 排队等待时间
+    }
+
+
+class RS485Bus:
+    """独占串口的RS-485总线，工作线程串行执行队列中的事务"""
+
+    # port可以是串口名，也可以是已打开的串口对象（如hcp1020_sim.SimulatedSerial）
+    def __init__(self, port, baudrate=9600, timeout=1):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        if isinstance(port, str):
+            import serial  # 只有按串口名打开时才需要pyserial
+            self.ser = serial.Serial(
+                port=port,
+                baudrate=baudrate,
+                bytesize=8,
+                parity='N',
+                stopbits=1,
+                timeout=timeout
+            )
+        else:
+            self.ser = port
+            self.ser.timeout = timeout
+        self.silence = frame_silence(baudrate)
+        self.ser.inter_byte_timeout = self.silence
+        self._codec = FrameCodec()  # 只在工作线程中使用
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()  # 同优先级按提交顺序执行
+        self._stats_lock = threading.Lock()
+        self._bus_stats = _new_stats()
+        self._slave_stats = {}
+        self._started = time.perf_counter()
+        self._error = None  # 工作线程意外退出时的异常
+        self._worker = threading.Thread(target=self._run, name=f"rs485-{self.ser.port}", daemon=True)
+        self._worker.start()
+
+    # 提交一帧请求，返回Future，结果为响应字节
+    def submit(self, slave_id, frame, priority=PRIORITY_WRITE):
+        future = Future()
+        self._queue.put((priority, next(self._seq), (slave_id, frame, future, time.perf_counter())))
+        if self._error is not None:
+            self._fail_pending()  # 工作线程已退出，不会再执行
+        return future
+
+    # 提交并等待响应
+    def transact(self, slave_id, frame, priority=PRIORITY_WRITE):
+        return self.submit(slave_id, frame, priority).result()
+
+    # 排队等待执行的事务数
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    # 获取某个从站地址的控制器句柄
+    def slave(self, slave_id, **kwargs):
+        return BusSlaveController(self, slave_id, **kwargs)
+
+    def close(self):
+        # 排在所有事务之后的结束标记
+        self._queue.put((float('inf'), next(self._seq), None))
+        self._worker.join()
+        self.ser.close()
+
+    # 工作线程：单个事务出错时该事务以异常结束，继续执行后面的事务
+    def _run(self):
+        last_end = 0.0
+        late_until = None  # 上一个事务超时后，迟到的响应可能到达的最晚时刻（time.monotonic）
+        future = None
+        try:
+            while True:
+                _, _, item = self._queue.get()
+                if item is None:
+                    break
+                slave_id, frame, future, queued_at = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                start = time.perf_counter()
+                try:
+                    if late_until is not None:
+                        # 丢弃上一个超时请求迟到的响应
+                        late_until, _ = settle_after_timeout(self.ser, frame[1], late_until, self.silence)
+                        last_end = time.perf_counter()
+                    # 与上一帧之间保留3.5字符静默，不做额外等待
+                    gap = last_end + self.silence - time.perf_counter()
+                    if gap > 0:
+                        time.sleep(gap)
+                    start = time.perf_counter()
+                    self.ser.reset_input_buffer()
+                    self.ser.write(frame)
+                    response = bytes(self._codec.read_frame(self.ser))
+                    last_end = time.perf_counter()
+                    if not response:
+                        late_until = time.monotonic() + self.timeout
+                    self._record(slave_id, frame, response, start - queued_at, last_end - start)
+                except Exception as e:
+                    last_end = time.perf_counter()
+                    future.set_exception(e)
+                    self._record(slave_id, frame, b'', start - queued_at, 0.0)
+                    continue
+                future.set_result(response)
+        except BaseException as e:
+            # 工作线程意外退出：当前、排队中和之后提交的事务都以该异常结束，transact()不会永久阻塞
+            self._error = e
+            if future is not None and not future.done():
+                future.set_exception(e)
+            self._fail_pending()
+            raise
+
+    def _fail_pending(self):
+        while True:
+            try:
+                _, _, item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[2].set_running_or_notify_cancel():
+                item[2].set_exception(self._error)
+
+    def _record(self, slave_id, frame, response, queue_time, busy_time):
+        complete = len(response) >= 3 and len(response) == expected_response_length(response)
+        with self._stats_lock:
+            for stats in (self._bus_stats, self._slave_stats.setdefault(slave_id, _new_stats())):
+                stats['transactions'] += 1
+                stats['errors'] += 0 if complete else 1
+                stats['bytes_sent'] += len(frame)
+                stats['bytes_received'] += len(response)
+                stats['busy_time'] += busy_time
+                stats['queue_time'] += queue_time
+
+    # 返回总线和各从站的吞吐统计
+    def stats(self):
+        elapsed = time.perf_counter() - self._started
+        with self._stats_lock:
+            result = {'bus': dict(self._bus_stats),
+                      'slaves': {sid: dict(s) for sid, s in self._slave_stats.items()}}
+        for stats in [result['bus']] + list(result['slaves'].values()):
+            stats['transactions_per_second'] = stats['transactions'] / elapsed if elapsed else 0.0
+            stats['utilization'] = stats['busy_time'] / elapsed if elapsed else 0.0
+        result['bus']['queue_depth'] = self.queue_depth()
+        return result
+
+
+class BusSlaveController(HCP1020Controller):
+    """挂在共享总线上的HCP1020从站句柄，不单独打开串口
+
+    close()不做任何事，句柄关闭后仍可使用；串口属于总线，由RS485Bus.close()关闭
+    """
+
+    def __init__(self, bus, slave_id=1, max_read_registers=125, shadow=False, shadow_ttl=5.0,
+                 retries=2, retry_backoff=0.01, retry_backoff_max=0.2):
+        self.bus = bus
+        self.port = None
+        self.baudrate = bus.baudrate
+        self.timeout = bus.timeout
+        self._ser = None
+        self.pool = None
+        self._init_state(slave_id, max_read_registers, shadow, shadow_ttl, retries, retry_backoff,
+                         retry_backoff_max)
+
+    def close(self):
+        pass
+
+    # 总线工作线程每次事务前清空输入，剩余字节无需在句柄中读取
+    def _drain(self):
+        return b''
+
+    # 等待响应的超时时间由总线决定，deadline不起作用
+    def _transact(self, frame, function_code, register, deadline=None):
+        # 帧由工作线程发送，需从编码缓冲区复制出来
+        frame = bytes(frame)
+        start = time.perf_counter()
+        response = self.bus.transact(self.slave_id, frame, request_priority(frame[1:]))
+        elapsed = time.perf_counter() - start
+        if self.instrumentation is not None:
+            self.instrumentation.observe('full_frame', elapsed)  # 含总线排队时间
+            if not response:
+                self.instrumentation.count('timeouts')
+        self._record_latency(elapsed, response)
+        return response
+
+
+# 使用示例：同一条RS-485总线上的三台电源
+if __name__ == "__main__":
+    bus = RS485Bus('/dev/ttyUSB0', baudrate=9600)
+    psus = [bus.slave(slave_id) for slave_id in (1, 2, 3)]
+    try:
+        for psu in psus:
+            print(psu.slave_id, psu.query_actual_values())
+        print(bus.stats())
+    finally:
+        for psu in psus:
+            psu.set_output(False)
+        bus.close()
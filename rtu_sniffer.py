@@ -0,0 +1,395 @@
+import queue
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+from crc16 import crc16
+from modbus_rtu import MAX_FRAME, frame_silence
+
+# MODBUS RTU总线监听：后台线程成块读取串口，按帧长+CRC逐步切分字节流，再把请求和响应配对
+# 帧长按功能码推算（请求和响应两种解释都尝试，以CRC为准），无法确定帧长的字节在总线空闲后按垃圾字节输出
+
+# timestamp为帧首字节到达时间，end为末字节到达时间（time.time()，按每字符时间由读取时刻反推）
+Frame = namedtuple('Frame', ['timestamp', 'end', 'data', 'crc_ok'])
+# request/response为Frame或None（未应答的请求/无对应请求的响应）；rtt为请求末字节到响应首字节的时间
+Transaction = namedtuple('Transaction', ['timestamp', 'slave_id', 'function_code', 'request', 'response',
+                                         'rtt', 'fields'])
+
+_U16 = struct.Struct('>H')
+
+
+# 帧首部可能对应的完整帧长（请求和响应两种解释），需要更多字节才能确定时返回None
+def candidate_lengths(buf):
+    function_code = buf[1]
+    if function_code & 0x80:  # 异常响应
+        return (5,)
+    if function_code == 0x03:  # 请求8字节；响应5+字节数
+        if len(buf) < 3:
+            return None
+        return (8, 5 + buf[2])
+    if function_code == 0x06:  # 请求和响应都是8字节
+        return (8,)
+    if function_code == 0x10:  # 响应8字节；请求9+字节数
+        if len(buf) < 7:
+            return None
+        return (8, 9 + buf[6])
+    return ()
+
+
+class FrameSplitter:
+    """增量切帧：feed()喂入读到的字节块，返回其中完整的帧"""
+
+    def __init__(self, baudrate=115200):
+        self.char_time = 10 / baudrate  # 8N1每字符10位
+        self._buf = bytearray()
+        self._offset = 0        # _buf[0]在整个字节流中的偏移
+        self._chunks = deque()  # (块末尾在字节流中的偏移, 块末字节到达时间)
+        self._garbage = None    # 尚未输出的垃圾字节
+        self._garbage_end = 0.0
+        self.stats = {'bytes': 0, 'frames': 0, 'garbage_bytes': 0}
+
+    def _time_at(self, offset):
+        # offset处（不含）之前最后一个字节的到达时间：找到包含它的读取块，按字符时间反推
+        for end, timestamp in self._chunks:
+            if end >= offset:
+                return timestamp - (end - offset) * self.char_time
+        return self._chunks[-1][1] if self._chunks else time.time()
+
+    def _consume(self, length):
+        del self._buf[:length]
+        self._offset += length
+        while self._chunks and self._chunks[0][0] <= self._offset:
+            self._chunks.popleft()
+
+    def _emit(self, frames, length):
+        end = self._time_at(self._offset + length)
+        frames.append(Frame(end - (length - 1) * self.char_time, end, bytes(self._buf[:length]), True))
+        self._consume(length)
+        self.stats['frames'] += 1
+
+    # 连续的垃圾字节合并为一个CRC错误的帧输出，抓包中不丢失任何字节
+    def _emit_garbage(self, frames):
+        if self._garbage is None:
+            return
+        data = bytes(self._garbage)
+        end = self._garbage_end
+        frames.append(Frame(end - (len(data) - 1) * self.char_time, end, data, False))
+        self.stats['garbage_bytes'] += len(data)
+        self._garbage = None
+
+    def _drop_byte(self):
+        if self._garbage is None:
+            self._garbage = bytearray()
+        self._garbage.append(self._buf[0])
+        self._garbage_end = self._time_at(self._offset + 1)
+        self._consume(1)
+
+    def _split(self, final):
+        frames = []
+        buf = self._buf
+        while buf:
+            lengths = candidate_lengths(buf) if len(buf) >= 2 else None
+            if lengths is None:
+                if final:
+                    self._drop_byte()
+                    continue
+                break
+            matched = None
+            waiting = False
+            for length in lengths:
+                if length > MAX_FRAME:
+                    continue
+                if length > len(buf):
+                    waiting = True
+                elif crc16(memoryview(buf)[:length]) == 0:
+                    matched = length
+                    break
+            if matched is not None:
+                self._emit_garbage(frames)
+                self._emit(frames, matched)
+                continue
+            # 可能还没收完，或是未知功能码：等待更多字节，除非总线已空闲或积压超过最大帧长
+            if (waiting or not lengths) and not final and len(buf) < MAX_FRAME:
+                break
+            self._drop_byte()
+        if final:
+            self._emit_garbage(frames)
+        return frames
+
+    def feed(self, data, timestamp=None):
+        """timestamp为这块数据最后一个字节的到达时间，默认取当前时间"""
+        self._buf += data
+        self._chunks.append((self._offset + len(self._buf), time.time() if timestamp is None else timestamp))
+        self.stats['bytes'] += len(data)
+        return self._split(False)
+
+    # 总线已空闲（超过帧间静默没有新字节）：剩余字节不可能再组成完整帧
+    def flush(self):
+        return self._split(True)
+
+
+# 解析帧内容；请求还是响应由帧长推断（FC06请求与响应相同，按请求解析）
+def decode_frame(frame):
+    data = frame.data if isinstance(frame, Frame) else frame
+    fields = {'slave_id': data[0], 'function_code': data[1] & 0x7F}
+    function_code = data[1]
+    if function_code & 0x80:
+        fields['exception'] = data[2]
+        fields['kind'] = 'response'
+    elif function_code == 0x03 and len(data) != 8:
+        count = data[2] // 2
+        fields['values'] = list(struct.unpack_from('>%dH' % count, data, 3))
+        fields['kind'] = 'response'
+    elif function_code in (0x03, 0x06) or (function_code == 0x10 and len(data) == 8):
+        fields['register'] = _U16.unpack_from(data, 2)[0]
+        key = 'count' if function_code != 0x06 else 'value'
+        fields[key] = _U16.unpack_from(data, 4)[0]
+        fields['kind'] = 'response' if function_code == 0x10 else 'request'
+    elif function_code == 0x10:
+        fields['register'], count = struct.unpack_from('>HH', data, 2)
+        fields['count'] = count
+        fields['values'] = list(struct.unpack_from('>%dH' % count, data, 7))
+        fields['kind'] = 'request'
+    else:
+        fields['kind'] = 'unknown'
+    return fields
+
+
+def _transaction(request, response):
+    first = request if request is not None else response
+    fields = {}
+    if response is not None:
+        fields.update(decode_frame(response))
+    if request is not None:
+        fields.update(decode_frame(request))  # 请求中的地址/数量优先
+    fields.pop('kind', None)
+    rtt = response.timestamp - request.end if request is not None and response is not None else None
+    return Transaction(first.timestamp, first.data[0], first.data[1] & 0x7F, request, response, rtt, fields)
+
+
+# 把帧流配对成事务；request_timeout秒内没有响应的请求作为未应答事务输出，CRC错误的帧跳过
+def pair_frames(frames, request_timeout=1.0):
+    pending = None
+    for frame in frames:
+        if not frame.crc_ok or len(frame.data) < 4:
+            continue
+        if pending is not None and frame.timestamp - pending.end > request_timeout:
+            yield _transaction(pending, None)
+            pending = None
+        kind = decode_frame(frame)['kind']
+        same = pending is not None and pending.data[0] == frame.data[0] and \
+            pending.data[1] == frame.data[1] & 0x7F
+        # FC06的请求和响应相同：紧跟在同地址同功能码请求后的帧视为响应
+        if same and (kind == 'response' or frame.data[1] == 0x06):
+            yield _transaction(pending, frame)
+            pending = None
+        elif kind == 'response':
+            yield _transaction(None, frame)
+        else:
+            if pending is not None:
+                yield _transaction(pending, None)
+            pending = frame
+    if pending is not None:
+        yield _transaction(pending, None)
+
+
+# 抓包文件格式（小端），每帧只多6字节:
+#   文件头: 'RTUC' | 版本(B) | 保留(3字节) | 波特率(I) | 起始时间(q，微秒)
+#   每帧:   距上一帧首字节的时间(i，微秒) | 长度(H，最高位=CRC正确) | 帧数据
+#   长度为0的记录只推进时间，用于间隔超过int32范围（约35分钟）的情况
+CAPTURE_MAGIC = b'RTUC'
+CAPTURE_VERSION = 1
+_CAPTURE_HEADER = struct.Struct('<4sB3xIq')
+_CAPTURE_RECORD = struct.Struct('<iH')
+_CRC_OK_FLAG = 0x8000
+_MAX_RECORD = 0x7FFF
+_MAX_DELTA = 0x7FFFFFFF
+
+
+class CaptureWriter:
+    """把帧写入紧凑的二进制抓包文件，时间戳精度1微秒"""
+
+    def __init__(self, path, baudrate):
+        self.baudrate = baudrate
+        self._file = open(path, 'wb', buffering=1 << 16)
+        self._last = int(time.time() * 1e6)
+        self._file.write(_CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, baudrate, self._last))
+        self.frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, frame):
+        timestamp = int(round(frame.timestamp * 1e6))
+        delta = timestamp - self._last
+        while delta > _MAX_DELTA:
+            self._file.write(_CAPTURE_RECORD.pack(_MAX_DELTA, 0))
+            delta -= _MAX_DELTA
+        self._last = timestamp
+        flag = _CRC_OK_FLAG if frame.crc_ok else 0
+        data = frame.data
+        for start in range(0, len(data), _MAX_RECORD):  # 超长的垃圾字节分成多条记录
+            piece = data[start:start + _MAX_RECORD]
+            self._file.write(_CAPTURE_RECORD.pack(delta if start == 0 else 0, flag | len(piece)))
+            self._file.write(piece)
+        self.frames += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# 读取抓包文件，逐帧返回Frame
+def read_capture(path):
+    with open(path, 'rb') as f:
+        header = f.read(_CAPTURE_HEADER.size)
+        if len(header) < _CAPTURE_HEADER.size:
+            raise ValueError(f"不是有效的抓包文件: {path}")
+        magic, version, baudrate, now = _CAPTURE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f"不是有效的抓包文件: {path}")
+        char_time = 10 / baudrate
+        while True:
+            record = f.read(_CAPTURE_RECORD.size)
+            if len(record) < _CAPTURE_RECORD.size:
+                return
+            delta, length = _CAPTURE_RECORD.unpack(record)
+            now += delta
+            if not length & _MAX_RECORD:
+                continue
+            data = f.read(length & _MAX_RECORD)
+            timestamp = now / 1e6
+            yield Frame(timestamp, timestamp + (len(data) - 1) * char_time, data, bool(length & _CRC_OK_FLAG))
+
+
+class BusSniffer:
+    """总线监听器：后台线程持续读取串口，frames()/transactions()在调用线程中切帧和配对
+
+    gap: 超过该时间没有新字节即认为总线空闲；USB转串口有毫秒级的读取延迟，默认不小于20ms
+    capture: CaptureWriter，切出的每一帧同时写入抓包文件
+    """
+
+    def __init__(self, port, baudrate=115200, gap=None, read_size=4096, capture=None):
+        if isinstance(port, str):
+            import serial  # 只有按串口名打开时才需要pyserial
+            self.ser = serial.Serial(port=port, baudrate=baudrate, bytesize=8, parity='N', stopbits=1)
+        else:
+            self.ser = port
+        self.gap = gap if gap is not None else max(frame_silence(baudrate), 0.02)
+        self.ser.timeout = self.gap
+        self.read_size = read_size
+        set_buffer_size = getattr(self.ser, 'set_buffer_size', None)
+        if set_buffer_size is not None:
+            set_buffer_size(rx_size=1 << 16)  # Windows驱动缓冲区默认只有4KB
+        self.splitter = FrameSplitter(baudrate)
+        self.capture = capture
+        self._chunks = queue.Queue()
+        self._running = False
+        self._reader = None
+        self.stats = {'reads': 0, 'max_backlog': 0}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._reader = threading.Thread(target=self._read_loop, name='rtu-sniffer', daemon=True)
+            self._reader.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+
+    def close(self):
+        self.stop()
+        self.ser.close()
+
+    # 读取线程只做读串口和打时间戳，切帧在消费者线程中进行，读取不会被处理速度拖慢
+    def _read_loop(self):
+        ser = self.ser
+        while self._running:
+            data = ser.read(1)  # 阻塞等待第一个字节，最多gap秒
+            if not data:
+                continue
+            waiting = ser.in_waiting
+            if waiting:
+                data += ser.read(min(waiting, self.read_size))
+            self._chunks.put((time.time(), data))
+            self.stats['reads'] += 1
+
+    def frames(self, duration=None):
+        """切出的帧，duration秒后或stop()后结束"""
+        self.start()
+        deadline = time.monotonic() + duration if duration is not None else None
+        while self._running or not self._chunks.empty():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            backlog = self._chunks.qsize()
+            if backlog > self.stats['max_backlog']:
+                self.stats['max_backlog'] = backlog
+            try:
+                timestamp, data = self._chunks.get(timeout=self.gap)
+                frames = self.splitter.feed(data, timestamp)
+            except queue.Empty:
+                frames = self.splitter.flush()
+            for frame in frames:
+                if self.capture is not None:
+                    self.capture.write(frame)
+                yield frame
+        for frame in self.splitter.flush():
+            if self.capture is not None:
+                self.capture.write(frame)
+            yield frame
+
+    def transactions(self, duration=None, request_timeout=1.0):
+        return pair_frames(self.frames(duration), request_timeout)
+
+
+def format_transaction(t):
+    stamp = time.strftime('%H:%M:%S', time.localtime(t.timestamp)) + f'.{int(t.timestamp % 1 * 1000):03d}'
+    request = t.request.data.hex(' ').upper() if t.request else '-'
+    response = t.response.data.hex(' ').upper() if t.response else '无响应'
+    rtt = f'{t.rtt * 1000:.1f}ms' if t.rtt is not None else ''
+    return f"{stamp} 从站{t.slave_id} FC{t.function_code:02X} {request} -> {response} {rtt} {t.fields}"
+
+
+# 命令行：监听串口或回放抓包文件
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="MODBUS RTU总线监听")
+    parser.add_argument('port', nargs='?', help="监听的串口")
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--duration', type=float, help="监听时长（秒），默认直到Ctrl+C")
+    parser.add_argument('--capture', help="同时写入的抓包文件")
+    parser.add_argument('--replay', help="回放抓包文件，不打开串口")
+    args = parser.parse_args()
+
+    if args.replay:
+        for transaction in pair_frames(read_capture(args.replay)):
+            print(format_transaction(transaction))
+    else:
+        writer = CaptureWriter(args.capture, args.baudrate) if args.capture else None
+        sniffer = BusSniffer(args.port, args.baudrate, capture=writer)
+        try:
+            for transaction in sniffer.transactions(args.duration):
+                print(format_transaction(transaction))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sniffer.close()
+            if writer is not None:
+                writer.close()
+            print(f"统计: {sniffer.splitter.stats} {sniffer.stats}")
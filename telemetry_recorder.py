@@ -0,0 +1,172 @@
+import glob
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from register_map import decode_samples
+
+# 遥测记录：原始寄存器样本按列存储在定长分块文件中，只追加写入，可用NumPy内存映射读取
+#
+# 分块文件格式（小端）:
+#   头部16字节: 魔数'HCPT' | 版本(B) | 保留(B) | 寄存器数n(H) | 起始寄存器地址(H) | 样本数count(I) | 填充2字节
+#   时间戳列:   float64 x count
+#   从站地址列: uint8 x count（补齐到偶数字节）
+#   寄存器列:   uint16 x count，共n列，第j列为起始地址+j的寄存器
+
+MAGIC = b'HCPT'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHHIxx')
+
+Chunk = namedtuple('Chunk', ['timestamps', 'slaves', 'registers', 'base_register'])
+
+
+class TelemetryRecorder:
+    """遥测记录器：record()只追加到内存数组，写文件由后台线程完成，不阻塞轮询循环
+
+    后台写入失败（磁盘满、无权限等）时停止写入，之后的record()/flush()/close()抛出该异常
+    """
+
+    def __init__(self, directory, registers=3, base_register=0x0000, chunk_size=65536, flush_interval=5.0):
+        self.directory = directory
+        self.registers = registers
+        self.base_register = base_register
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        existing = glob.glob(os.path.join(directory, 'chunk_*.bin'))
+        self._next_chunk = max([int(os.path.basename(p)[6:-4]) for p in existing], default=-1) + 1
+        self._queue = queue.Queue()
+        self.error = None  # 后台写入失败的异常
+        self._writer = threading.Thread(target=self._write_loop, name='telemetry-writer', daemon=True)
+        self._writer.start()
+        self._new_buffers()
+        self.samples = 0
+        self.chunks_written = 0
+
+    def _new_buffers(self):
+        self._timestamps = array('d')
+        self._slaves = array('B')
+        self._columns = [array('H') for _ in range(self.registers)]
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # 记录一个样本：registers为从base_register开始的原始寄存器值
+    def record(self, slave_id, registers, timestamp=None):
+        if self.error is not None:
+            raise self.error
+        self._timestamps.append(time.time() if timestamp is None else timestamp)
+        self._slaves.append(slave_id)
+        for column, value in zip(self._columns, registers):
+            column.append(value)
+        self.samples += 1
+        if len(self._timestamps) >= self.chunk_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    # 把当前缓冲区交给后台线程写成一个分块文件
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if not self._timestamps:
+            return
+        self._queue.put((self._next_chunk, self._timestamps, self._slaves, self._columns))
+        self._next_chunk += 1
+        self._new_buffers()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_chunk(*item)
+            except Exception as e:
+                self.error = e  # 之后排队的分块不再写入
+                break
+            self.chunks_written += 1
+
+    def _write_chunk(self, index, timestamps, slaves, columns):
+        count = len(timestamps)
+        if count % 2:
+            slaves.append(0)  # 补齐，使寄存器列按2字节对齐
+        path = os.path.join(self.directory, f'chunk_{index:08d}.bin')
+        # 先写临时文件再改名，读者不会看到写了一半的分块
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, len(columns), self.base_register, count))
+                f.write(_little_endian(timestamps))
+                f.write(slaves.tobytes())
+                for column in columns:
+                    f.write(_little_endian(column))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+            raise
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+# 内存映射读取一个分块，返回的数组直接引用文件内容，不复制
+def load_chunk(path):
+    import numpy as np
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    magic, version, _, n_registers, base_register, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"不是有效的遥测分块文件: {path}")
+    offset = HEADER.size
+    timestamps = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    offset += count * 8
+    slaves = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    offset += count + count % 2
+    registers = np.frombuffer(data, dtype='<u2', count=count * n_registers, offset=offset).reshape(n_registers, count)
+    return Chunk(timestamps, slaves, registers, base_register)
+
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, 'chunk_*.bin')))
+
+
+# 加载目录下全部样本，返回物理量数组（需要NumPy）
+# 寄存器需包含0x0000-0x0002（实际电压、电流、状态）
+def load_telemetry(directory, slave_id=None):
+    import numpy as np
+    chunks = [load_chunk(path) for path in chunk_paths(directory)]
+    if not chunks:
+        return {}
+    for chunk in chunks:
+        if chunk.base_register != 0x0000 or chunk.registers.shape[0] < 3:
+            raise ValueError("分块不包含实际值寄存器0x0000-0x0002")
+    timestamps = np.concatenate([c.timestamps for c in chunks])
+    slaves = np.concatenate([c.slaves for c in chunks])
+    registers = np.concatenate([c.registers[:3] for c in chunks], axis=1)
+    if slave_id is not None:
+        mask = slaves == slave_id
+        timestamps, slaves, registers = timestamps[mask], slaves[mask], registers[:, mask]
+    result = decode_samples(registers.T)  # 分块按列存储，转置为每行一个样本（视图，不复制）
+    result['timestamp'] = timestamps
+    result['slave'] = slaves
+    return result
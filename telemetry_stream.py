@@ -0,0 +1,151 @@
+import time
+from array import array
+from collections import namedtuple
+
+from modbus_rtu import ModbusError
+from register_map import from_raw, decode_status, decode_samples
+
+# 高速遥测采样：连续读取实际值寄存器块(0x0000-0x0002)，以链路允许的最高速率采样
+
+Sample = namedtuple('Sample', ['timestamp', 'voltage', 'current', 'status'])
+
+
+class RingBuffer:
+    """定长环形缓冲区，用array存储时间戳和原始寄存器，长时间运行内存不增长"""
+
+    def __init__(self, capacity, registers=3):
+        self.capacity = capacity
+        self.registers = registers
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('H', bytes(2 * capacity * registers))
+        self.count = 0        # 已写入的总样本数
+        self.overwritten = 0  # 被覆盖的旧样本数
+
+    def append(self, timestamp, registers):
+        index = self.count % self.capacity
+        if self.count >= self.capacity:
+            self.overwritten += 1
+        self.timestamps[index] = timestamp
+        base = index * self.registers
+        self.values[base:base + self.registers] = array('H', registers)
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # 按时间顺序返回缓冲区中的 (时间戳, 寄存器元组)
+    def snapshot(self):
+        size = len(self)
+        start = self.count - size
+        result = []
+        for i in range(start, self.count):
+            index = i % self.capacity
+            base = index * self.registers
+            result.append((self.timestamps[index], tuple(self.values[base:base + self.registers])))
+        return result
+
+
+def _to_sample(timestamp, registers):
+    return Sample(timestamp, from_raw('voltage', registers[0]), from_raw('current', registers[1]),
+                  decode_status(registers[2]))
+
+
+class TelemetrySampler:
+    """遥测流采样器，每decimation次成功采样保留并输出一个样本
+    recorder可传入telemetry_recorder.TelemetryRecorder，保留的样本同时写入磁盘
+    """
+
+    def __init__(self, controller, capacity=10000, decimation=1, recorder=None):
+        self.controller = controller
+        self.recorder = recorder
+        self.buffer = RingBuffer(capacity)
+        self.decimation = max(1, int(decimation))
+        self.polls = 0     # 读请求次数
+        self.dropped = 0   # 读失败（超时/帧错误）丢失的样本数
+        self._started = None
+
+    def _stop(self, start, duration, count, emitted):
+        if count is not None and emitted >= count:
+            return True
+        return duration is not None and time.monotonic() - start >= duration
+
+    def _poll(self):
+        try:
+            return self.controller.read_registers(0x0000, 3)
+        except ModbusError:
+            return None
+
+    async def _apoll(self):
+        try:
+            return await self.controller.read_registers(0x0000, 3)
+        except ModbusError:
+            return None
+
+    def _accept(self, registers):
+        self.polls += 1
+        if registers is None:
+            self.dropped += 1
+            return None
+        if (self.polls - self.dropped - 1) % self.decimation:
+            return None
+        timestamp = time.time()
+        self.buffer.append(timestamp, registers)
+        if self.recorder is not None:
+            self.recorder.record(self.controller.slave_id, registers, timestamp)
+        return _to_sample(timestamp, registers)
+
+    # 同步生成器：duration秒或count个样本后结束，两者都不给则一直运行
+    def stream(self, duration=None, count=None):
+        start = self._started = time.monotonic()
+        emitted = 0
+        while not self._stop(start, duration, count, emitted):
+            sample = self._accept(self._poll())
+            if sample is not None:
+                emitted += 1
+                yield sample
+
+    # 异步迭代器，配合modbus_async中的异步控制器使用
+    async def astream(self, duration=None, count=None):
+        start = self._started = time.monotonic()
+        emitted = 0
+        while not self._stop(start, duration, count, emitted):
+            sample = self._accept(await self._apoll())
+            if sample is not None:
+                emitted += 1
+                yield sample
+
+    # 缓冲区中的全部样本（按时间顺序）
+    def samples(self):
+        return [_to_sample(t, regs) for t, regs in self.buffer.snapshot()]
+
+    # 缓冲区中的全部样本一次性解析为NumPy数组（需要NumPy），键见register_map.decode_samples
+    def arrays(self):
+        import numpy as np
+        buffer = self.buffer
+        order = np.arange(buffer.count - len(buffer), buffer.count) % buffer.capacity
+        values = np.frombuffer(buffer.values, dtype=np.uint16).reshape(-1, buffer.registers)
+        result = decode_samples(values[order])
+        result['timestamp'] = np.frombuffer(buffer.timestamps, dtype=np.float64)[order]
+        return result
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            'polls': self.polls,
+            'dropped': self.dropped,
+            'stored': self.buffer.count,
+            'overwritten': self.buffer.overwritten,
+            'poll_rate': self.polls / elapsed if elapsed else 0.0,
+            'sample_rate': self.buffer.count / elapsed if elapsed else 0.0
+        }
+
+
+# 使用示例：10秒连续采样，每10次保留一个样本
+if __name__ == "__main__":
+    from Modbus import HCP1020Controller
+
+    psu = HCP1020Controller('/dev/ttyUSB0', slave_id=1, baudrate=115200)
+    sampler = TelemetrySampler(psu, capacity=1000, decimation=10)
+    for sample in sampler.stream(duration=10):
+        print(f"{sample.timestamp:.3f} {sample.voltage:.2f}V {sample.current:.3f}A")
+    print(sampler.stats())
@@ -1,11 +1,13 @@
 import serial
 import time
+from link_bench import LinkTest
 
 # 配置参数
 PORT_A = 'COM3'   # PortA的串口号 (发送端)
 PORT_B = 'COM6'   # PortB的串口号 (接收端)
 BAUD_RATE = 115200
 TEST_MESSAGE = b'Hello from PortA to PortB!\n'
+BENCH_SECONDS = 2  # 连通后运行链路基准的时长（秒），0表示只做连通测试；完整扫描见 link_bench.py
 
 # 初始化两个串口
 try:
@@ -35,7 +37,7 @@ try:
     print(f"从PortA发送: {TEST_MESSAGE.decode().strip()}")
     ser_a.write(TEST_MESSAGE)
     
-    # 在PortB接收数据
+    # 在PortB接收数据（readline按串口timeout阻塞等待，无需轮询）
     print("在PortB等待接收数据...")
     start_time = time.time()
     timeout = 5  # 5秒超时
@@ -45,9 +47,15 @@ try:
         if data:
             print(f"PortB收到: {data.decode().strip()}")
             break
-        time.sleep(0.1)  # 短暂等待
     else:
         print("错误: 未在PortB收到数据!")
+
+    # 链路基准：PortA持续发送、PortB同时接收，测量吞吐、单向延时和丢包
+    if data and BENCH_SECONDS:
+        result = LinkTest(ser_a, ser_b).run(BENCH_SECONDS)
+        print(f"吞吐: {result['throughput']:.0f} B/s (线速的{result['efficiency'] * 100:.1f}%)，"
+              f"延时p50/p99: {result['latency_p50'] * 1000:.2f}/{result['latency_p99'] * 1000:.2f} ms，"
+              f"丢失{result['bytes_lost']}字节，损坏{result['packets_corrupted']}包")
     
 except serial.SerialException as e:
     print(f"串口错误: {e}")
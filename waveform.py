@@ -0,0 +1,143 @@
+import math
+import time
+from array import array
+from collections import namedtuple
+
+from instrumentation import percentile
+from Modbus import sleep_until
+from realtime import fast_switching
+from modbus_rtu import encode_write_frames, ModbusError, WRITE_FRAME_SIZE
+from register_map import register_address, to_raw
+
+# 设定值波形流：斜坡、阶跃、正弦或任意采样点组成的波形先整体编译为一块连续的0x06写入帧缓冲区
+# （含CRC），发送时只按截止时间逐帧取出发送，不再做单位换算、打包和CRC计算。
+# 每个点有自己的截止时间（相对开始时刻）；链路跟不上时，下一点也已到期的点直接跳过，
+# 保证设备上始终是最新的点。结束后报告定时误差和跳过的点数。
+
+# name: 'set_voltage'或'set_current'；interval: 点间隔（秒）；values: 物理值序列
+Waveform = namedtuple('Waveform', ['name', 'interval', 'values'])
+
+# frames: 连续帧缓冲区，第i帧为frames[8*i:8*i+8]；raw/offsets: 各帧的寄存器值和截止时间（秒）
+# points: 编译前的点数（相邻相同的寄存器值合并为一帧）；duration: 最后一点的时刻（第一点为0），
+# 如ramp(..., duration=1.0, interval=0.1)共11点，duration为1.0
+CompiledWaveform = namedtuple('CompiledWaveform', ['register', 'frames', 'raw', 'offsets', 'points', 'duration'])
+
+
+def _count(duration, interval):
+    return max(int(round(duration / interval)), 1)
+
+
+# 从start线性变化到stop，含终点
+def ramp(name, start, stop, duration, interval):
+    n = _count(duration, interval)
+    return Waveform(name, interval, array('d', (start + (stop - start) * i / n for i in range(n + 1))))
+
+
+# 阶跃序列：levels为 [(值, 持续时间), ...]
+def steps(name, levels, interval):
+    values = array('d')
+    for value, duration in levels:
+        values.extend([value] * _count(duration, interval))
+    return Waveform(name, interval, values)
+
+
+def sine(name, offset, amplitude, frequency, duration, interval, phase=0.0):
+    omega = 2 * math.pi * frequency
+    return Waveform(name, interval, array('d', (offset + amplitude * math.sin(omega * i * interval + phase)
+                                                for i in range(_count(duration, interval)))))
+
+
+# 任意采样点
+def samples(name, values, interval):
+    return Waveform(name, interval, array('d', values))
+
+
+# 首尾相接多段波形，各段的寄存器和点间隔必须相同
+def concat(*waveforms):
+    first = waveforms[0]
+    values = array('d')
+    for waveform in waveforms:
+        if waveform.name != first.name or waveform.interval != first.interval:
+            raise ValueError("拼接的波形必须是同一寄存器、同一点间隔")
+        values.extend(waveform.values)
+    return Waveform(first.name, first.interval, values)
+
+
+# 编译为预编码帧；limit为物理值上限（如OVP），超出或为负时抛出ValueError
+def compile_waveform(waveform, slave_id, limit=None):
+    raw = array('H')
+    offsets = array('d')
+    last = None
+    for i, value in enumerate(waveform.values):
+        if value < 0 or (limit is not None and value > limit):
+            raise ValueError(f"第{i}点超出范围: {value}")
+        reg = to_raw(waveform.name, value)
+        if reg > 0xFFFF:
+            raise ValueError(f"第{i}点超出寄存器范围: {value}")
+        if reg == last:
+            continue  # 与上一点相同，设备上的值不变，不必重发
+        raw.append(reg)
+        offsets.append(i * waveform.interval)
+        last = reg
+    register = register_address(waveform.name)
+    return CompiledWaveform(register, encode_write_frames(slave_id, register, raw), raw, offsets,
+                            len(waveform.values), max(len(waveform.values) - 1, 0) * waveform.interval)
+
+
+# 测量一次写入事务的耗时（取第95百分位），作为该链路和设备能跟上的最小点间隔
+def measure_write_time(controller, compiled, repeat=20):
+    frame = memoryview(compiled.frames)[:WRITE_FRAME_SIZE]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        controller.send_frame(frame, 0x06, compiled.register, compiled.raw[0])
+        times.append(time.perf_counter() - start)
+    return percentile(sorted(times), 95)
+
+
+# 按截止时间发送编译好的波形，返回报告
+# switch_interval: 运行期间的sys.setswitchinterval值（秒，如0.0005，见realtime.fast_switching），默认不修改
+def stream_waveform(controller, compiled, switch_interval=None):
+    frames = memoryview(compiled.frames)
+    offsets = compiled.offsets
+    raw = compiled.raw
+    register = compiled.register
+    count = len(offsets)
+    lateness = array('d')
+    skipped = failed = 0
+    with fast_switching(switch_interval):
+        start = time.monotonic()
+        for i in range(count):
+            deadline = start + offsets[i]
+            now = time.monotonic()
+            if i + 1 < count and now >= start + offsets[i + 1]:
+                skipped += 1  # 下一点也已到期，本点已过时
+                continue
+            if now < deadline:
+                sleep_until(deadline)
+                now = time.monotonic()
+            lateness.append(now - deadline)
+            offset = i * WRITE_FRAME_SIZE
+            try:
+                controller.send_frame(frames[offset:offset + WRITE_FRAME_SIZE], 0x06, register, raw[i])
+            except ModbusError:
+                failed += 1  # 单点失败不中断波形，下一点会覆盖
+        sleep_until(start + compiled.duration)
+        elapsed = time.monotonic() - start
+
+    errors = sorted(lateness)
+    sent = len(errors)
+    return {
+        'points': compiled.points,
+        'frames': count,             # 合并相同值后需要发送的帧数
+        'sent': sent,
+        'skipped': skipped,          # 链路跟不上而跳过的点
+        'failed': failed,
+        'duration': compiled.duration,
+        'elapsed': elapsed,
+        'rate': sent / elapsed if elapsed else 0.0,
+        'timing_error_mean': sum(errors) / sent if sent else 0.0,
+        'timing_error_p50': percentile(errors, 50),
+        'timing_error_p99': percentile(errors, 99),
+        'timing_error_max': errors[-1] if errors else 0.0
+    }